@@ -0,0 +1,63 @@
+"""
+Замер времени векторного объединения колонок DbWorking.coalesce_columns против старого построчного
+(совпадение результатов проверяет tests/test_coalesce.py)
+python -m benchmarks.bench_coalesce --rows 200000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from ozon_performance import DbWorking
+
+
+def make_stat_frame(rows, seed=0):
+    """Синтетический датасет statistics: строки отчетов разных видов, у каждой заполнена одна колонка из пары"""
+
+    rng = np.random.default_rng(seed)
+    data = {}
+    kind = rng.integers(0, 2, rows).astype(bool)
+    for _, first, second, _ in DbWorking.COALESCE_COLUMNS:
+        values = np.array([f'{v:.2f}'.replace('.', ',') for v in rng.uniform(0, 1000, rows)], dtype=object)
+        data[first] = np.where(kind, None, values)
+        data[second] = np.where(kind, values, None)
+    frame = pd.DataFrame(data, dtype=object)
+    # часть строк без значений в обеих колонках и с пустыми строками
+    frame.iloc[::97, :] = None
+    frame.iloc[::89, 1] = ''
+    return frame
+
+
+def legacy_coalesce(dataset):
+    """Построчное объединение до векторизации"""
+
+    for target, first, second, missing in DbWorking.COALESCE_COLUMNS:
+        dataset[target] = dataset[[first, second]].fillna(missing).apply(
+            lambda x: x.iloc[0] if x.iloc[1] == missing else x.iloc[1], axis=1)
+        dataset.drop(columns=[first, second], inplace=True)
+    return dataset
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    args = parser.parse_args()
+
+    frame = make_stat_frame(args.rows)
+
+    start = time.perf_counter()
+    old = legacy_coalesce(frame.copy())
+    old_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    new = DbWorking.coalesce_columns(frame.copy())
+    new_time = time.perf_counter() - start
+
+    print(f'rows: {args.rows}, result rows: {len(old)}, {len(new)}')
+    print(f'legacy: {old_time:.2f} s')
+    print(f'vectorized: {new_time:.3f} s ({old_time / new_time:.0f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Сравнение старого и векторного приведения типов дневной статистики
+python -m benchmarks.bench_daily --rows 1000000
+"""
+import argparse
+import io
+import time
+from datetime import datetime, date, timedelta
+
+import numpy as np
+import pandas as pd
+
+import db_work
+
+
+def make_daily_csv(rows, seed=0):
+    """Синтетический дневной отчет в формате Ozon (разделитель ;, десятичная запятая)"""
+
+    rng = np.random.default_rng(seed)
+    start = date(2023, 1, 1)
+    days = [str(start + timedelta(days=int(d))) for d in rng.integers(0, 90, rows)]
+    frame = pd.DataFrame({
+        'ID': rng.integers(1000000, 9999999, rows),
+        'Название': [f'Кампания {n}' for n in rng.integers(0, 500, rows)],
+        'Дата': days,
+        'Показы': rng.integers(0, 100000, rows),
+        'Клики': rng.integers(0, 1000, rows),
+        'Расход, ₽': rng.uniform(0, 10000, rows).round(2),
+        'Средняя ставка, ₽': rng.uniform(0, 100, rows).round(2),
+        'Заказы, шт.': rng.integers(0, 50, rows),
+        'Заказы, ₽': rng.uniform(0, 100000, rows).round(2),
+    })
+    return frame.to_csv(sep=';', decimal=',', index=False).encode()
+
+
+def legacy_read_daily(content, api_id, account_id):
+    """Приведение типов до векторизации"""
+
+    data = pd.read_csv(io.BytesIO(content), sep=';')
+    data['api_id'] = api_id
+    data['account_id'] = account_id
+    data.rename(columns=db_work.DAILY_COLUMNS, inplace=True)
+
+    dtypes = {'api_id': 'int', 'account_id': 'int', 'campaign_id': 'int', 'campaign_name': 'str',
+              'date': 'datetime', 'views': 'int', 'clicks': 'int', 'expense': 'float', 'avrg_bid': 'float',
+              'orders': 'int', 'revenue': 'float'}
+    for col in data.columns:
+        if dtypes[col] == 'int':
+            data[col] = data[col].astype('int')
+        elif dtypes[col] == 'float':
+            data[col] = data[col].astype(str).str.replace(',', '.')
+            data[col] = data[col].astype('float')
+        elif dtypes[col] == 'datetime':
+            data[col] = data[col].apply(lambda x: datetime.strptime(x, '%Y-%m-%d').date())
+    return data
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    res = func(*args)
+    return res, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+
+    content = make_daily_csv(args.rows)
+    old, old_time = timed(legacy_read_daily, content, '123', '1')
+    new, new_time = timed(db_work.read_daily, content, '123', '1')
+
+    pd.testing.assert_frame_equal(old.astype(new.dtypes.to_dict()), new)
+
+    print(f'rows: {args.rows}, csv: {len(content) / 1e6:.1f} MB')
+    print(f'legacy: {old_time:.2f} s')
+    print(f'vectorized: {new_time:.2f} s ({old_time / new_time:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""
+Сквозной замер загрузки N аккаунтов через parser.py против локального тестового сервера
+daily - parser.download_accounts, как в рабочем запуске (без записи в БД)
+statistics - заказ отчетов statistics, ожидание через ReportPoller и разбор скачанных отчетов
+Выводит аккаунтов в минуту, запросов в секунду и пиковую память; --save сохраняет результат как базовый,
+--compare сравнивает с сохраненным
+python -m benchmarks.bench_e2e --accounts 50 --campaigns 20 --days 90 --rate-429 0.02
+python -m benchmarks.bench_e2e --mode statistics --accounts 20 --build-time 3 --camp-lim 8 --save base.json
+"""
+import argparse
+import json
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import config
+from benchmarks.mock_ozon import MockServer, MockSettings
+
+
+def peak_rss_mb():
+    """Пиковая память процесса, МБ (ru_maxrss в КБ на linux и в байтах на macos)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1)
+
+
+def make_accounts(n):
+    """Ключи тестовых аккаунтов (account_id, client_id, client_secret)"""
+    return [(n_acc, f'{10000 + n_acc}-{n_acc}@advertising.performance.ozon.ru', f'secret{n_acc}')
+            for n_acc in range(n)]
+
+
+def run_daily(parser, accounts, upload_rate=0):
+    """upload_rate - скорость имитации записи в БД, строк в секунду, 0 - без записи"""
+    import db_work
+    from upload_pipeline import UploadPipeline
+
+    def upload(batch):
+        if upload_rate > 0:
+            time.sleep(batch.shape[0] / upload_rate)
+        return 'ok'
+
+    if config.pipeline_writers > 0:
+        # конвейер как в parser.py, запись идет во время загрузки
+        pipeline = UploadPipeline(upload, writers=config.pipeline_writers, max_pending=config.pipeline_queue,
+                                  logger=parser.logger).start()
+        pool = parser.download_accounts(accounts, pipeline=pipeline)
+        result = pipeline.close()
+        return {'jobs': pool.summary(), 'pipeline': result}, result['rows']
+
+    pool = parser.download_accounts(accounts)
+    if parser.stream_batches:
+        # потоковая сборка как в parser.py
+        files = [file for job in pool.jobs if job.result is not None for file in job.result]
+        batches = db_work.iter_batches(db_work.iter_daily(files), max_rows=config.stream_batch_rows)
+    else:
+        df = db_work.make_dataset_from_frames([job.result for job in pool.jobs if job.result is not None])
+        batches = [] if df is None else [(df, [])]
+    rows = 0
+    for batch, _ in batches:
+        upload(batch)
+        rows += batch.shape[0]
+    return pool.summary(), rows
+
+
+def run_statistics(parser, accounts, folder, days, camp_lim, interval):
+    from datetime import date, timedelta
+    from ozon_performance import OzonPerformance, DbWorking
+    from report_poller import ReportPoller
+    from worker_pool import WorkerPool
+
+    date_from = str(date.today() - timedelta(days=days))
+    date_to = str(date.today() - timedelta(days=1))
+    poller = ReportPoller(interval=interval, workers=config.workers)
+
+    def order(account_id, client_id, client_secret):
+        ozon = OzonPerformance(account_id=account_id, client_id=client_id, client_secret=client_secret,
+                               camp_lim=camp_lim, api_url=config.api_url)
+        ozon.collect_data(date_from, date_to, statistics=True)
+        ozon.save_data(path_=folder, statistics=True, poller=poller)
+
+    pool = WorkerPool(workers=config.workers, logger=parser.logger)
+    for keys in accounts:
+        pool.submit(f'{keys[0]}-{keys[1]}', order, *keys)
+    pool.run()
+    reports = poller.run()
+
+    rows = sum(DbWorking.stat_read_trans2(DbWorking.read_source(source), api_id=api_id,
+                                          account_id=account_id).shape[0]
+               for source, api_id, account_id in DbWorking.stat_sources(folder))
+    return {'jobs': pool.summary(), 'reports': reports}, rows
+
+
+def compare(result, baseline):
+    """Изменение метрик относительно базового замера"""
+    for key in ('accounts_per_min', 'requests_per_s', 'peak_rss_mb', 'seconds'):
+        old, new = baseline.get(key), result.get(key)
+        if old:
+            print(f'{key}: {old} -> {new} ({(new - old) / old * 100:+.1f}%)')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=['daily', 'statistics'], default='daily')
+    parser.add_argument('--accounts', type=int, default=20)
+    parser.add_argument('--campaigns', type=int, default=10)
+    parser.add_argument('--objects', type=int, default=5)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--workers', type=int, default=config.workers)
+    parser.add_argument('--build-time', type=float, default=2.0)
+    parser.add_argument('--build-jitter', type=float, default=0.5)
+    parser.add_argument('--rate-429', type=float, default=0.0)
+    parser.add_argument('--stat-rows', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.0)
+    # camp_lim=1 - отчеты csv, больше 1 - zip с csv по кампаниям
+    parser.add_argument('--camp-lim', type=int, default=8)
+    # строк в порции потоковой сборки daily, 0 - один датасет в памяти
+    parser.add_argument('--stream-batch-rows', type=int, default=0)
+    # потоков записи конвейера и имитация скорости записи в БД, строк в секунду
+    parser.add_argument('--pipeline-writers', type=int, default=0)
+    parser.add_argument('--pipeline-queue', type=int, default=config.pipeline_queue)
+    parser.add_argument('--upload-rate', type=float, default=0)
+    parser.add_argument('--interval', type=float, default=1.0)
+    parser.add_argument('--rate-per-client', type=float, default=config.rate_per_client)
+    parser.add_argument('--rate-global', type=float, default=config.rate_global)
+    # файл времени формирования отчетов, общий для нескольких запусков
+    parser.add_argument('--build-times')
+    parser.add_argument('--save', help='сохранить результат в json')
+    parser.add_argument('--compare', help='сравнить с сохраненным результатом')
+    args = parser.parse_args()
+
+    server = MockServer(MockSettings(campaigns=args.campaigns, objects=args.objects, build_time=args.build_time,
+                                     build_jitter=args.build_jitter, rate_429=args.rate_429,
+                                     stat_rows=args.stat_rows, latency=args.latency))
+    folder = tempfile.mkdtemp() + '/'
+
+    # настройки подменяются до импорта parser, который по ним создает сессию, кэши и ограничитель
+    config.api_url = server.start()
+    config.workers = args.workers
+    config.lookback_days = args.days
+    config.spool_files = 0
+    config.parquet_store = 0
+    config.stream_batch_rows = args.stream_batch_rows
+    config.pipeline_writers = args.pipeline_writers
+    config.pipeline_queue = args.pipeline_queue
+    config.path_ = folder
+    config.token_cache_file = folder + 'token_cache.json'
+    config.discovery_cache_file = folder + 'discovery_cache.json'
+    config.checkpoint_file = folder + 'checkpoints.json'
+    config.build_times_file = args.build_times or folder + 'build_times.json'
+    config.rate_per_client = args.rate_per_client
+    config.rate_global = args.rate_global
+    config.rate_global_burst = max(config.rate_global_burst, int(args.rate_global))
+
+    import parser as entry
+
+    accounts = make_accounts(args.accounts)
+    start = time.perf_counter()
+    try:
+        if args.mode == 'daily':
+            summary, rows = run_daily(entry, accounts, args.upload_rate)
+        else:
+            summary, rows = run_statistics(entry, accounts, folder, args.days, args.camp_lim, args.interval)
+        seconds = time.perf_counter() - start
+        served = server.stats()
+    finally:
+        server.stop()
+        shutil.rmtree(folder, ignore_errors=True)
+
+    result = {'mode': args.mode,
+              'accounts': args.accounts,
+              'seconds': round(seconds, 2),
+              'accounts_per_min': round(args.accounts / seconds * 60, 1),
+              'requests': served['requests'],
+              'requests_per_s': round(served['requests'] / seconds, 1),
+              'sent_429': served['sent_429'],
+              'mb_sent': served['mb_sent'],
+              'rows': rows,
+              'peak_rss_mb': peak_rss_mb(),
+              'summary': summary,
+              'endpoints': served['endpoints'],
+              'http': entry.session.stats(),
+              'metrics': {key: value for key, value in entry.run_metrics.summary().items()
+                          if key in ('endpoints', 'rows', 'responses_429')}}
+    print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(result, json.load(file))
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(result, file, ensure_ascii=False, indent=2, default=str)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Сверка однопроходного чтения отчетов statistics со старым двухпроходным и замер времени
+по всем известным вариантам шапки
+python -m benchmarks.bench_stat_reader --rows 20000
+"""
+import argparse
+import io
+import time
+
+import numpy as np
+import pandas as pd
+
+from ozon_performance import DbWorking
+
+# известные варианты шапки отчетов Ozon
+HEADERS = {
+    'search_promo': ['Дата', 'ID заказа', 'Номер заказа', 'Ozon ID', 'Ozon ID рекламируемого товара', 'Артикул',
+                     'Наименование', 'Количество', 'Цена продажи', 'Стоимость, руб.', 'Ставка, %',
+                     'Ставка, руб.', 'Расход, руб.'],
+    'sku_rub': ['День', 'sku', 'Название товара', 'Цена товара (руб.)', 'Показы', 'Клики', 'CTR (%)',
+                'Средняя ставка за 1000 показов (руб.)', 'Расход (руб., с НДС)', 'Заказы', 'Выручка (руб.)',
+                'Заказы модели', 'Выручка с заказов модели (руб.)'],
+    'sku_currency': ['День', 'sku', 'Название товара', 'Цена товара, ₽', 'Показы', 'Клики', 'CTR (%)',
+                     'Ср. цена 1000 показов, ₽', 'Расход, ₽, с НДС', 'Заказы', 'Выручка, ₽', 'Заказы модели',
+                     'Выручка с заказов модели, ₽'],
+    'banner': ['День', 'Баннер', 'Тип страницы', 'Условие показа', 'Платформа', 'Показы', 'Клики', 'CTR (%)',
+               'Охват', 'Ср. цена 1000 показов, ₽', 'Расход, ₽, с НДС', 'Расход за минусом бонусов, ₽, с НДС'],
+    'search_cpc': ['День', 'sku', 'Название товара', 'Цена товара, ₽', 'Показы', 'Клики', 'CTR (%)',
+                   'Ср. цена клика, ₽', 'Средняя ставка, ₽', 'Расход, ₽', 'Заказы', 'Выручка, ₽',
+                   'Заказы модели', 'Выручка с заказов модели, ₽'],
+}
+
+TEXT = ('Артикул', 'Наименование', 'Название товара', 'Баннер', 'Тип страницы', 'Условие показа', 'Платформа')
+
+
+def make_stat_csv(header, rows, camp=1234567, seed=0):
+    """Синтетический отчет: строка с номером кампании, шапка, данные, строка итогов"""
+
+    rng = np.random.default_rng(seed)
+    lines = [f';Кампания по продвижению товаров № {camp}, период 01.01.2023-31.03.2023', ';'.join(header)]
+    for i in range(rows):
+        values = []
+        for col in header:
+            if col in ('Дата', 'День'):
+                values.append(f'{rng.integers(1, 29):02d}.{rng.integers(1, 4):02d}.2023')
+            elif col in TEXT:
+                values.append(f'Товар {rng.integers(0, 1000)}')
+            elif '₽' in col or 'руб' in col or '%' in col:
+                values.append(f'{rng.uniform(0, 1000):.2f}'.replace('.', ','))
+            else:
+                values.append(str(rng.integers(0, 100000)))
+        lines.append(';'.join(values))
+    lines.append('Всего;' + ';'.join('' for _ in header[1:]))
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def legacy_read(content):
+    """Чтение до однопроходного разбора: два чтения и python-парсер ради skipfooter"""
+
+    data = pd.read_csv(io.BytesIO(content), sep=';', header=1, skipfooter=1, engine='python')
+    camp = pd.read_csv(io.BytesIO(content), sep=';', header=0, nrows=0).columns[-1].split(',')[0].split()[-1]
+    return camp, data
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20000)
+    args = parser.parse_args()
+
+    for name, header in HEADERS.items():
+        content = make_stat_csv(header, args.rows)
+
+        start = time.perf_counter()
+        old_camp, old = legacy_read(content)
+        old_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        new_camp, new = DbWorking.read_stat_csv(content)
+        new_time = time.perf_counter() - start
+
+        assert old_camp == new_camp, (old_camp, new_camp)
+        pd.testing.assert_frame_equal(old, new)
+        print(f'{name}: ok, legacy {old_time:.2f} s, single pass {new_time:.2f} s ({old_time / new_time:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
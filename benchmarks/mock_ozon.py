@@ -0,0 +1,272 @@
+"""
+Локальный тестовый сервер API Ozon Performance для бенчмарков
+Отдает те же методы, что использует OzonPerformance: token, campaign, objects, statistics (phrases, attribution),
+статус отчета, файл отчета и daily. Время формирования отчетов, доля ответов 429 и размер отчетов настраиваются
+python -m benchmarks.mock_ozon --port 8800 --build-time 2 --rate-429 0.05
+"""
+import argparse
+import io
+import json
+import random
+import threading
+import time
+import uuid as uuid_
+import zipfile
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from benchmarks.bench_stat_reader import HEADERS, make_stat_csv
+
+
+class MockSettings:
+    """
+    Параметры тестового сервера
+    campaigns - кампаний в аккаунте, objects - объектов в кампании
+    build_time, build_jitter - время формирования отчета statistics и его разброс, сек
+    rate_429 - доля запросов, на которые сервер отвечает 429, retry_after - значение заголовка Retry-After
+    stat_rows - строк в отчете statistics по одной кампании
+    latency - задержка каждого ответа, сек
+    """
+    def __init__(self, campaigns=10, objects=5, build_time=2.0, build_jitter=0.5, rate_429=0.0, retry_after='1',
+                 stat_rows=200, latency=0.0, seed=0):
+        self.campaigns = campaigns
+        self.objects = objects
+        self.build_time = build_time
+        self.build_jitter = build_jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.stat_rows = stat_rows
+        self.latency = latency
+        self.seed = seed
+
+
+def make_daily(campaigns, date_from, date_to, seed=0):
+    """Дневной отчет в формате Ozon: строка на кампанию и день"""
+
+    rng = random.Random(seed)
+    day_from = date.fromisoformat(date_from)
+    days = (date.fromisoformat(date_to) - day_from).days + 1
+    lines = ['ID;Название;Дата;Показы;Клики;Расход, ₽;Средняя ставка, ₽;Заказы, шт.;Заказы, ₽']
+    for camp in campaigns:
+        for d in range(days):
+            lines.append(f'{camp};Кампания {camp};{day_from + timedelta(days=d)};{rng.randint(0, 100000)};'
+                         f'{rng.randint(0, 1000)};{rng.uniform(0, 10000):.2f};{rng.uniform(0, 100):.2f};'
+                         f'{rng.randint(0, 50)};{rng.uniform(0, 100000):.2f}'.replace('.', ','))
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def make_report(campaigns, rows, seed=0):
+    """Отчет statistics: csv по одной кампании или zip с csv по каждой, как у Ozon"""
+
+    if len(campaigns) == 1:
+        return make_stat_csv(HEADERS['sku_currency'], rows, camp=campaigns[0], seed=seed), 'text/csv'
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for num, camp in enumerate(campaigns):
+            archive.writestr(f'{camp}.csv', make_stat_csv(HEADERS['sku_currency'], rows, camp=camp, seed=seed + num))
+    return buffer.getvalue(), 'application/zip'
+
+
+class MockOzon:
+    """
+    Состояние тестового сервера: токены, заказанные отчеты и счетчики запросов
+    """
+    def __init__(self, settings):
+        self.settings = settings
+        self.rng = random.Random(settings.seed)
+        self.tokens = {}
+        self.reports = {}
+        self.counters = {}
+        self.sent_429 = 0
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+
+    def count(self, endpoint, size=0):
+        with self.lock:
+            self.counters[endpoint] = self.counters.get(endpoint, 0) + 1
+            self.bytes_sent += size
+
+    def throttle(self):
+        """Случайный ответ 429 с долей rate_429"""
+        with self.lock:
+            if self.rng.random() < self.settings.rate_429:
+                self.sent_429 += 1
+                return True
+        return False
+
+    def campaigns(self, client_id):
+        api_id = client_id.split('-')[0]
+        return [f'{api_id}{n:04d}' for n in range(self.settings.campaigns)]
+
+    def campaign(self, camp, n):
+        """Кампания с датами: созданы в разные дни последнего года, у каждой третьей дата окончания через месяц"""
+        created = date.today() - timedelta(days=(n * 37) % 400)
+        stopped = n % 3 == 2
+        to_date = str(created + timedelta(days=30)) if stopped else None
+        return {'id': camp, 'title': f'Кампания {camp}',
+                'state': 'CAMPAIGN_STATE_STOPPED' if stopped else 'CAMPAIGN_STATE_RUNNING',
+                'fromDate': str(created), 'toDate': to_date,
+                'createdAt': f'{created}T10:00:00Z', 'updatedAt': f'{date.today()}T10:00:00Z'}
+
+    def order(self, kind, body):
+        """Заказ отчета, готов через build_time +- build_jitter"""
+        build = max(self.settings.build_time + self.rng.uniform(-1, 1) * self.settings.build_jitter, 0)
+        uuid = str(uuid_.uuid4())
+        with self.lock:
+            self.reports[uuid] = {'kind': kind, 'campaigns': body['campaigns'],
+                                  'ready': time.monotonic() + build}
+        return uuid
+
+    def stats(self):
+        with self.lock:
+            return {'requests': sum(self.counters.values()),
+                    'endpoints': dict(self.counters),
+                    'sent_429': self.sent_429,
+                    'mb_sent': round(self.bytes_sent / 1e6, 2),
+                    'reports': len(self.reports)}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    mock = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, endpoint, status, body, content_type='application/json', headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.mock.count(endpoint, len(body))
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def client(self):
+        """client_id по токену запроса или None"""
+        token = (self.headers.get('Authorization') or '').split(' ')[-1]
+        return self.mock.tokens.get(token)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self.read_body()
+        if self.mock.settings.latency > 0:
+            time.sleep(self.mock.settings.latency)
+
+        if url.path == '/api/client/token':
+            token = uuid_.uuid4().hex
+            self.mock.tokens[token] = body['client_id']
+            return self.send('token', 200, {'access_token': token, 'token_type': 'Bearer', 'expires_in': 1800})
+
+        if self.client() is None:
+            return self.send('unauthorized', 401, {'error': 'unauthorized'})
+        if self.mock.throttle():
+            return self.send('429', 429, {'error': 'too many requests'},
+                             headers={'Retry-After': self.mock.settings.retry_after})
+
+        kinds = {'/api/client/statistics': 'statistics',
+                 '/api/client/statistics/phrases': 'phrases',
+                 '/api/client/statistics/attribution': 'attribution'}
+        if url.path in kinds:
+            return self.send(kinds[url.path], 200, {'UUID': self.mock.order(kinds[url.path], body)})
+        self.send('not_found', 404, {'error': 'not found'})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip('/').split('/')
+        if self.mock.settings.latency > 0:
+            time.sleep(self.mock.settings.latency)
+
+        client_id = self.client()
+        if client_id is None:
+            return self.send('unauthorized', 401, {'error': 'unauthorized'})
+        if self.mock.throttle():
+            return self.send('429', 429, {'error': 'too many requests'},
+                             headers={'Retry-After': self.mock.settings.retry_after})
+
+        if url.path == '/api/client/campaign':
+            return self.send('campaign', 200, {'list': [self.mock.campaign(camp, n)
+                                                        for n, camp in enumerate(self.mock.campaigns(client_id))]})
+        if len(parts) == 5 and parts[2] == 'campaign' and parts[4] == 'objects':
+            return self.send('objects', 200, {'list': [{'id': f'{parts[3]}{n:03d}'}
+                                                       for n in range(self.mock.settings.objects)]})
+        if url.path == '/api/client/statistics/daily':
+            content = make_daily(query.get('campaigns', []), query['dateFrom'][0], query['dateTo'][0],
+                                 seed=self.mock.settings.seed)
+            return self.send('daily', 200, content, content_type='text/csv')
+        if url.path == '/api/client/statistics/report':
+            report = self.mock.reports.get(query['UUID'][0])
+            if report is None or time.monotonic() < report['ready']:
+                return self.send('report', 404, {'error': 'report not found'})
+            content, content_type = make_report(report['campaigns'], self.mock.settings.stat_rows,
+                                                seed=self.mock.settings.seed)
+            return self.send('report', 200, content, content_type=content_type)
+        if len(parts) == 4 and parts[2] == 'statistics':
+            report = self.mock.reports.get(parts[3])
+            if report is None:
+                return self.send('status', 404, {'error': 'report not found'})
+            state = 'OK' if time.monotonic() >= report['ready'] else 'IN_PROGRESS'
+            return self.send('status', 200, {'UUID': parts[3], 'state': state})
+        self.send('not_found', 404, {'error': 'not found'})
+
+
+class MockServer:
+    """
+    Тестовый сервер в фоновом потоке, url - адрес для OzonPerformance(api_url=...)
+    """
+    def __init__(self, settings=None, host='127.0.0.1', port=0):
+        self.mock = MockOzon(settings if settings is not None else MockSettings())
+        handler = type('MockHandler', (Handler,), {'mock': self.mock})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.url = f'http://{host}:{self.server.server_address[1]}'
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        return self.mock.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--campaigns', type=int, default=10)
+    parser.add_argument('--objects', type=int, default=5)
+    parser.add_argument('--build-time', type=float, default=2.0)
+    parser.add_argument('--build-jitter', type=float, default=0.5)
+    parser.add_argument('--rate-429', type=float, default=0.0)
+    parser.add_argument('--stat-rows', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = MockServer(MockSettings(campaigns=args.campaigns, objects=args.objects, build_time=args.build_time,
+                                     build_jitter=args.build_jitter, rate_429=args.rate_429,
+                                     stat_rows=args.stat_rows, latency=args.latency), port=args.port)
+    print('Тестовый сервер', server.url)
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        print(server.stats())
+    finally:
+        server.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+import json
+import os
+import threading
+import time
+
+
+class JsonCache:
+    """
+    Потокобезопасный кэш с временем жизни записей, сохраняется в json-файл
+    path=None - кэш только в памяти
+    default_ttl - время жизни записи по умолчанию, сек
+    Истекшие записи удаляются при чтении файла и при каждой записи, файл пишется вне общей блокировки
+    """
+    def __init__(self, path=None, default_ttl=3600):
+        self.path = path
+        self.default_ttl = default_ttl
+        self.lock = threading.RLock()
+        self.file_lock = threading.Lock()
+        self.version = 0
+        self.written = 0
+        self.data = self._prune(self._load())
+
+    def _load(self):
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _prune(data):
+        now = time.time()
+        return {key: entry for key, entry in data.items() if entry['expires_at'] > now}
+
+    def _dump(self):
+        """
+        Сохраняет снимок данных; вызывается без self.lock, более старый снимок не пишется поверх нового
+        """
+        if self.path is None:
+            return
+        with self.lock:
+            self.data = self._prune(self.data)
+            self.version += 1
+            version = self.version
+            snapshot = json.dumps(self.data)
+        with self.file_lock:
+            if version <= self.written:
+                return
+            tmp = f'{self.path}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as file:
+                file.write(snapshot)
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, self.path)
+            self.written = version
+
+    def get(self, key, margin=0):
+        """
+        Возвращает значение, если до истечения срока осталось больше margin секунд
+        """
+        with self.lock:
+            entry = self.data.get(str(key))
+            if entry is None or entry['expires_at'] - margin <= time.time():
+                return None
+            return entry['value']
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.default_ttl
+        with self.lock:
+            self.data[str(key)] = {'value': value, 'expires_at': time.time() + ttl}
+        self._dump()
+
+    def delete(self, key):
+        with self.lock:
+            deleted = self.data.pop(str(key), None) is not None
+        if deleted:
+            self._dump()
+
+    def delete_where(self, condition):
+        """
+        Удаляет записи, для значений которых condition(value) истинно, возвращает количество удаленных
+        """
+        with self.lock:
+            keys = [key for key, entry in self.data.items() if condition(entry['value'])]
+            for key in keys:
+                del self.data[key]
+        if len(keys) > 0:
+            self._dump()
+        return len(keys)
+
+
+class TokenCache:
+    """
+    Кэш токенов по client_id
+    Токен обновляется за refresh_margin секунд до истечения или при 401,
+    одновременно выполняется не больше одного обновления на client_id
+    """
+    def __init__(self, cache, refresh_margin=300, default_ttl=1800):
+        self.cache = cache
+        self.refresh_margin = refresh_margin
+        self.default_ttl = default_ttl
+        self.locks = {}
+        self.locks_lock = threading.Lock()
+
+    def _lock_for(self, client_id):
+        with self.locks_lock:
+            return self.locks.setdefault(client_id, threading.Lock())
+
+    def _store(self, client_id, auth):
+        if auth is not None:
+            self.cache.set(client_id, auth, ttl=auth.get('expires_in', self.default_ttl))
+        return auth
+
+    def get(self, client_id, fetch):
+        """
+        Возвращает действующий токен, fetch - функция получения нового токена
+        """
+        auth = self.cache.get(client_id, margin=self.refresh_margin)
+        if auth is not None:
+            return auth
+        with self._lock_for(client_id):
+            # пока ждали блокировку, токен мог обновить другой поток
+            auth = self.cache.get(client_id, margin=self.refresh_margin)
+            if auth is not None:
+                return auth
+            return self._store(client_id, fetch())
+
+    def refresh(self, client_id, fetch, stale=None):
+        """
+        Принудительно обновляет токен, отклоненный сервером
+        """
+        with self._lock_for(client_id):
+            auth = self.cache.get(client_id)
+            if auth is not None and stale is not None and auth['access_token'] != stale['access_token']:
+                return auth
+            self.cache.delete(client_id)
+            return self._store(client_id, fetch())
+
+
+class CheckpointStore:
+    """
+    Контрольные точки заказанных отчетов: по аккаунту, виду отчета, окну дат и набору кампаний
+    хранятся uuid, состояние (ORDERED, SAVED) и сохраненный файл
+    После перезапуска уже заказанные отчеты опрашиваются и скачиваются, а не заказываются заново
+    ttl - сколько хранится запись, сек (отчеты на стороне Ozon живут ограниченное время)
+    """
+    def __init__(self, cache, ttl=86400):
+        self.cache = cache
+        self.ttl = ttl
+
+    @staticmethod
+    def key(client_id, kind, date_from, date_to, campaigns):
+        return f"{client_id}:{kind}:{date_from}:{date_to}:{','.join(sorted(str(camp) for camp in campaigns))}"
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def ordered(self, key, uuid, ext, kind=None, size=None):
+        """
+        Отчет заказан, kind и size (кампаний x дней) нужны для оценки времени формирования
+        """
+        self.cache.set(key, {'uuid': uuid, 'ext': ext, 'state': 'ORDERED', 'file': None,
+                             'kind': kind, 'size': size, 'ordered_at': time.time()}, ttl=self.ttl)
+
+    def finish(self, key, state, file=None):
+        """
+        Итог ожидания отчета: SAVED запоминается вместе с файлом, TIMEOUT оставляет отчет на следующий запуск,
+        после ERROR и FAILED запись удаляется и отчет заказывается заново
+        """
+        entry = self.cache.get(key)
+        if entry is None:
+            return
+        if state == 'SAVED':
+            self.cache.set(key, {**entry, 'state': 'SAVED', 'file': file}, ttl=self.ttl)
+        elif state in ('ERROR', 'FAILED'):
+            self.cache.delete(key)
+
+    def ingested(self, files):
+        """
+        Данные отчетов из files записаны в БД: их контрольные точки больше не нужны и удаляются
+        """
+        files = set(os.path.normpath(file) for file in files)
+        return self.cache.delete_where(lambda entry: isinstance(entry, dict) and entry.get('state') == 'SAVED'
+                                       and entry.get('file') is not None and os.path.normpath(entry['file']) in files)
+
+
+_tokens = None
+_tokens_lock = threading.Lock()
+
+
+def configure_token_cache(path=None, refresh_margin=300):
+    """
+    Пересоздает общий кэш токенов
+    """
+    global _tokens
+    with _tokens_lock:
+        _tokens = TokenCache(JsonCache(path), refresh_margin=refresh_margin)
+        return _tokens
+
+
+def get_token_cache():
+    """
+    Возвращает общий кэш токенов, по умолчанию только в памяти
+    """
+    global _tokens
+    with _tokens_lock:
+        if _tokens is None:
+            _tokens = TokenCache(JsonCache())
+        return _tokens
+
+
+_discovery = None
+_discovery_lock = threading.Lock()
+
+
+def configure_discovery_cache(path=None, ttl=43200):
+    """
+    Пересоздает общий кэш кампаний и объектов
+    """
+    global _discovery
+    with _discovery_lock:
+        _discovery = JsonCache(path, default_ttl=ttl)
+        return _discovery
+
+
+def get_discovery_cache():
+    """
+    Возвращает общий кэш кампаний и объектов, по умолчанию только в памяти
+    """
+    global _discovery
+    with _discovery_lock:
+        if _discovery is None:
+            _discovery = JsonCache(default_ttl=43200)
+        return _discovery
+
+
+_checkpoints = None
+_checkpoints_lock = threading.Lock()
+
+
+def configure_checkpoints(path=None, ttl=86400):
+    """
+    Пересоздает общее хранилище контрольных точек отчетов
+    """
+    global _checkpoints
+    with _checkpoints_lock:
+        _checkpoints = CheckpointStore(JsonCache(path), ttl=ttl)
+        return _checkpoints
+
+
+def get_checkpoints():
+    """
+    Возвращает общее хранилище контрольных точек, по умолчанию только в памяти
+    """
+    global _checkpoints
+    with _checkpoints_lock:
+        if _checkpoints is None:
+            _checkpoints = CheckpointStore(JsonCache())
+        return _checkpoints
@@ -15,17 +15,93 @@ CH_DB_NAME = os.environ.get('ECOMRU_CH_DB_NAME', None)
 CH_USER = os.environ.get('ECOMRU_CH_USER', None)
 CH_PASSWORD = os.environ.get('ECOMRU_CH_PASSWORD', None)
 CH_PORT = os.environ.get('ECOMRU_CH_PORT', None)
+# сжатие при передаче и размер блока вставки в clickhouse
+CH_COMPRESS = 'lz4'
+CH_INSERT_BLOCK = 100000
+# повтор блока после сбоя с insert_deduplication_token: включается, только если у таблицы статистики есть
+# дедупликация (Replicated*MergeTree или non_replicated_deduplication_window), это проверяется при запуске;
+# 0 - блоки не повторяются
+CH_INSERT_DEDUP = 1
 
 
 PG_DB_PARAMS = f"postgresql://{PG_USER}:{PG_PASSWORD}@{PG_HOST}:{PG_PORT}/{PG_DB_NAME}"
+# размер порции COPY при записи в postgres
+PG_COPY_CHUNK = 50000
 
 using_db = 'clickhouse'
 data_folder = './data'
 
 delete_files = 1
 upl_into_db = 1
+# сохранять дневные отчеты в path_ (для отладки), данные в БД идут из памяти
+spool_files = 0
+# потоковая загрузка: отчеты копятся на диске и пишутся в БД порциями не больше stream_batch_rows строк,
+# 0 - один датасет в памяти; stream_by_account=1 - в порции только один аккаунт
+stream_batch_rows = 0
+stream_by_account = 0
+# конвейерная запись: данные аккаунта пишутся в БД сразу после загрузки, pipeline_writers потоков записи
+# (для clickhouse 1 - клиент не поддерживает параллельные запросы), pipeline_queue - аккаунтов в очереди
+# на запись, при заполнении загрузка ждет; 0 - запись после загрузки всех аккаунтов
+pipeline_writers = 0
+pipeline_queue = 4
+# сохранять отчеты в parquet (нужен pyarrow), хранилище не удаляется вместе с path_
+parquet_store = 0
+parquet_path = f'{data_folder}/parquet/'
 
 stat_table = 'ozon_perf_statistics'
+# последние загруженные даты по api_id, пересборка - python rebuild_watermarks.py
+watermark_table = 'ozon_perf_watermarks'
+# глубина загрузки для новых аккаунтов и окно поиска пропусков, дней
+lookback_days = 90
+# догружать пропущенные даты внутри окна lookback_days
+fill_gaps = 1
+# дни, за которые отчет получен, но статистики нет, - тоже покрытие; день считается пустым окончательно
+# через empty_settle_days дней, пока статистика по нему может появиться
+empty_days_table = 'ozon_perf_empty_days'
+empty_settle_days = 2
+# пропуски, между которыми не больше gap_merge_days загруженных дней, запрашиваются одним daily
+gap_merge_days = 14
+
+# адрес API Ozon Performance, для бенчмарков - адрес тестового сервера
+api_url = os.environ.get('OZON_PERF_API_URL', 'https://performance.ozon.ru:443')
+
+# пул соединений к API: количество хостов и соединений на хост
+http_pool_connections = 10
+http_pool_maxsize = 32
+
+# кэш токенов между запусками, обновление за token_refresh_margin секунд до истечения
+# файл с действующими токенами: data/ исключена из git (.gitignore) и из образа (.dockerignore)
+token_cache_file = f'{data_folder}/token_cache.json'
+token_refresh_margin = 300
+
+# кэш кампаний и объектов аккаунтов, сек
+discovery_cache_file = f'{data_folder}/discovery_cache.json'
+discovery_ttl = 43200
+
+# контрольные точки заказанных отчетов statistics/phrases/attribution: после перезапуска отчеты не заказываются
+# заново, а опрашиваются и скачиваются; время хранения, сек
+checkpoint_file = f'{data_folder}/checkpoints.json'
+checkpoint_ttl = 86400
+
+# время формирования отчетов по прошлым запускам: первый опрос статуса - к ожидаемой готовности отчета
+build_times_file = f'{data_folder}/build_times.json'
+
+# лимиты запросов к API: на client_id и общий на запуск, запросов в секунду
+rate_per_client = 2.0
+# до какой скорости она восстанавливается после 429, None - не выше rate_per_client
+rate_max_per_client = None
+rate_burst = 5
+rate_global = 20.0
+rate_global_burst = 20
+
+# количество одновременно обрабатываемых аккаунтов
+workers = 8
+# запись логов в отдельном потоке через очередь, рабочие потоки не ждут файлов
+log_queue = 1
+
+# метрики запуска: textfile для node_exporter (Prometheus) и json-сводка, None - не сохранять
+metrics_textfile = f'{data_folder}/ozon_perf.prom'
+metrics_summary = f'{data_folder}/run_summary.json'
 
 
 # создаем рабочую папку, если еще не создана
@@ -3,8 +3,12 @@ import numpy as np
 import time
 from datetime import datetime, date, timedelta
 import os
+import io
+import csv
 import glob
-from sqlalchemy import exc
+from sqlalchemy import exc, text
+
+import metrics
 
 
 def sql_query(query, engine, logger, type_='dict'):
@@ -70,6 +74,131 @@ def get_last_dates(table_name: str, engine, logger):
     return sql_query(query, engine, logger, type_='df')
 
 
+def create_watermarks(table_name: str, connection):
+    """Создать таблицу последних загруженных дат по аккаунтам"""
+
+    connection.execute(text(f"""
+                            CREATE TABLE IF NOT EXISTS {table_name} (
+                            api_id bigint PRIMARY KEY,
+                            max_date date NOT NULL,
+                            updated_at timestamp NOT NULL DEFAULT now()
+                            )
+                            """))
+
+
+def get_watermarks(table_name: str, engine, logger):
+    """Получить последние загруженные даты по аккаунтам из таблицы watermark"""
+
+    with engine.begin() as connection:
+        create_watermarks(table_name, connection)
+
+    query = f"""
+             SELECT 
+             api_id, 
+             max_date 
+             FROM {table_name}
+             """
+
+    return sql_query(query, engine, logger, type_='df')
+
+
+def update_watermarks(dataset, table_name: str, connection):
+    """Сдвинуть watermark по загруженному датасету (в транзакции записи данных)"""
+
+    marks = dataset.groupby('api_id')['date'].max()
+    if marks.shape[0] == 0:
+        return
+
+    connection.execute(text(f"""
+                            INSERT INTO {table_name} (api_id, max_date) 
+                            VALUES (:api_id, :max_date)
+                            ON CONFLICT (api_id) DO UPDATE 
+                            SET max_date = GREATEST({table_name}.max_date, EXCLUDED.max_date), 
+                            updated_at = now()
+                            """),
+                       [{'api_id': int(api_id), 'max_date': max_date} for api_id, max_date in marks.items()])
+
+
+def rebuild_watermarks(table_name: str, stat_table: str, engine, logger):
+    """Пересобрать watermark по таблице статистики"""
+
+    try:
+        with engine.begin() as connection:
+            create_watermarks(table_name, connection)
+            connection.execute(text(f"DELETE FROM {table_name}"))
+            connection.execute(text(f"""
+                                    INSERT INTO {table_name} (api_id, max_date) 
+                                    SELECT api_id, max(date) 
+                                    FROM {stat_table} 
+                                    GROUP BY api_id
+                                    """))
+        logger.info(f"{table_name} rebuilt")
+        return 'ok'
+    except (exc.DBAPIError, exc.SQLAlchemyError) as ex:
+        logger.error(f"db error: {ex}")
+        return None
+
+
+def get_coverage(table_name: str, date_from: str, engine, logger, empty_table=None):
+    """Получить даты, по которым есть статистика, по аккаунтам начиная с date_from
+    empty_table - таблица дней без статистики, такие дни тоже считаются загруженными"""
+
+    query = f"""
+             SELECT 
+             api_id, 
+             date 
+             FROM {table_name} 
+             WHERE date >= '{date_from}'
+             GROUP BY api_id, date
+             """
+    if empty_table is not None:
+        with engine.begin() as connection:
+            create_empty_days(empty_table, connection)
+        query += f"""
+             UNION 
+             SELECT 
+             api_id, 
+             date 
+             FROM {empty_table} 
+             WHERE date >= '{date_from}'
+             """
+
+    return sql_query(query, engine, logger, type_='df')
+
+
+def create_empty_days(table_name: str, connection):
+    """Создать таблицу дней, за которые отчет получен, но статистики нет"""
+
+    connection.execute(text(f"""
+                            CREATE TABLE IF NOT EXISTS {table_name} (
+                            api_id bigint NOT NULL,
+                            date date NOT NULL,
+                            PRIMARY KEY (api_id, date)
+                            )
+                            """))
+
+
+def add_empty_days(days, table_name: str, engine, logger):
+    """Записать дни без статистики, days - [(api_id, date), ...]"""
+
+    if len(days) == 0:
+        return 'ok'
+    try:
+        with engine.begin() as connection:
+            create_empty_days(table_name, connection)
+            connection.execute(text(f"""
+                                    INSERT INTO {table_name} (api_id, date) 
+                                    VALUES (:api_id, :date)
+                                    ON CONFLICT DO NOTHING
+                                    """),
+                               [{'api_id': int(api_id), 'date': day} for api_id, day in days])
+        logger.info(f"{len(days)} empty days recorded")
+        return 'ok'
+    except (exc.DBAPIError, exc.SQLAlchemyError) as ex:
+        logger.error(f"db error: {ex}")
+        return None
+
+
 def get_accounts(engine, logger):
     """Получить таблицу с аккаунтами"""
 
@@ -83,88 +212,215 @@ def get_accounts(engine, logger):
     return sql_query(query, engine, logger, type_='df')
 
 
-def make_dataset(path):
-    """Собирает датасет из загруженных данных"""
+DAILY_COLUMNS = {
+    'ID': 'campaign_id',
+    'Название': 'campaign_name',
+    'Дата': 'date',
+    'Показы': 'views',
+    'Клики': 'clicks',
+    'Расход, ₽': 'expense',
+    'Средняя ставка, ₽': 'avrg_bid',
+    'Заказы, шт.': 'orders',
+    'Заказы, ₽': 'revenue'
+}
 
-    columns = {
-        'ID': 'campaign_id',
-        'Название': 'campaign_name',
-        'Дата': 'date',
-        'Показы': 'views',
-        'Клики': 'clicks',
-        'Расход, ₽': 'expense',
-        'Средняя ставка, ₽': 'avrg_bid',
-        'Заказы, шт.': 'orders',
-        'Заказы, ₽': 'revenue'
-    }
-
-    dtypes = {
-        'api_id': 'int',
-        'account_id': 'int',
-        'campaign_id': 'int',
-        'campaign_name': 'str',
-        'date': 'datetime',
-        'views': 'int',
-        'clicks': 'int',
-        'expense': 'float',
-        'avrg_bid': 'float',
-        'orders': 'int',
-        'revenue': 'float'
-    }
-
-    csv_files = []
-    for folder in os.listdir(path):
-        csv_files += (glob.glob(os.path.join(path + folder + r'/daily', "*.csv")))
+# типы колонок дневной статистики, дата приводится отдельно
+DAILY_DTYPES = {
+    'api_id': 'int64',
+    'account_id': 'int64',
+    'campaign_id': 'int64',
+    'campaign_name': 'str',
+    'views': 'int64',
+    'clicks': 'int64',
+    'expense': 'float64',
+    'avrg_bid': 'float64',
+    'orders': 'int64',
+    'revenue': 'float64'
+}
 
-    if len(csv_files) == 0:
-        return None
 
-    else:
-        stat_data = []
-        for file in csv_files:
-            data = pd.read_csv(file, sep=';')
+def read_daily(source, api_id, account_id):
+    """Читает дневной отчет из файла или из содержимого ответа (bytes) и приводит типы"""
 
-            account_id = os.path.dirname(file).split('/')[-2].split('-')[0]
-            api_id = os.path.dirname(file).split('/')[-2].split('-')[1]
+    start = time.perf_counter()
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
 
-            data['api_id'] = api_id
-            data['account_id'] = account_id
+    # десятичная запятая разбирается при чтении
+    data = pd.read_csv(source, sep=';', decimal=',')
 
-            data.rename(columns=columns, inplace=True)
+    data['api_id'] = api_id
+    data['account_id'] = account_id
 
-            stat_data.append(data)
+    data.rename(columns=DAILY_COLUMNS, inplace=True)
 
-        dataset = pd.concat(stat_data, axis=0)
+    data = convert_daily(data)
+    metrics.get_metrics().observe_rows('parsed', data.shape[0], time.perf_counter() - start)
+    return data
 
-        for col in dataset.columns:
-            if dtypes[col] == 'int':
-                dataset[col] = dataset[col].astype('int', copy=False, errors='ignore')
-            elif dtypes[col] == 'float':
-                dataset[col] = dataset[col].astype(str).str.replace(',', '.')
-                dataset[col] = dataset[col].astype('float', copy=False, errors='ignore')
-            elif dtypes[col] == 'datetime':
-                # dataset[col] = pd.to_datetime(dataset[col], unit='D', errors='ignore')
-                dataset[col] = dataset[col].apply(lambda x: datetime.strptime(x, '%Y-%m-%d').date())
 
+def daily_dates(source):
+    """Даты, по которым в дневном отчете есть строки, читается только колонка даты"""
+
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    data = pd.read_csv(source, sep=';', usecols=['Дата'])
+    return set(pd.to_datetime(data['Дата'], format='%Y-%m-%d').dt.date)
+
+
+def drop_covered(dataset, coverage):
+    """Отбрасывает строки за дни, которые уже есть в покрытии coverage (api_id -> множество дат)"""
+
+    if coverage is None or dataset.shape[0] == 0:
         return dataset
+    mask = np.zeros(dataset.shape[0], dtype=bool)
+    api_ids = dataset['api_id'].to_numpy()
+    for api_id in pd.unique(api_ids):
+        covered = coverage.get(int(api_id))
+        if covered:
+            mask |= (api_ids == api_id) & dataset['date'].isin(covered).to_numpy()
+    return dataset[~mask] if mask.any() else dataset
 
 
-def add_into_table(dataset, table_name: str, engine, logger, attempts=1):
-    """Выполнить запись датасета в таблицу БД"""
+def convert_daily(dataset):
+    """Приводит типы колонок дневной статистики за один проход"""
 
-    with engine.begin() as connection:
-        n = 0
-        while n < attempts:
-            try:
-                res = dataset.to_sql(name=table_name, con=connection, if_exists='append', index=False)
-                logger.info(f"Upload to {table_name} - ok")
-                return 'ok'
-            except BaseException as ex:
-                logger.error(f"data to db: {ex}")
-                time.sleep(5)
-                n += 1
-        logger.error("data to db error")
+    if 'date' in dataset.columns:
+        dataset['date'] = pd.to_datetime(dataset['date'], format='%Y-%m-%d').dt.date
+
+    return dataset.astype({col: DAILY_DTYPES[col] for col in dataset.columns if col in DAILY_DTYPES})
+
+
+def make_dataset_from_frames(frames):
+    """Собирает датасет из отчетов, прочитанных в памяти"""
+
+    if len(frames) == 0:
         return None
 
+    return pd.concat(frames, axis=0)
+
+
+def daily_files(path):
+    """Дневные отчеты в папках аккаунтов: (файл, api_id, account_id), файлы одного аккаунта идут подряд"""
+
+    files = []
+    for folder in sorted(os.listdir(path)):
+        try:
+            account_id = folder.split('-')[0]
+            api_id = folder.split('-')[1]
+        except IndexError:
+            continue
+        for file in sorted(glob.glob(os.path.join(path + folder + r'/daily', "*.csv"))):
+            files.append((file, api_id, account_id))
+    return files
+
+
+def make_dataset(path):
+    """Собирает датасет из загруженных данных"""
+
+    csv_files = daily_files(path)
 
+    if len(csv_files) == 0:
+        return None
 
+    else:
+        stat_data = []
+        for file, api_id, account_id in csv_files:
+            stat_data.append(read_daily(file, api_id=api_id, account_id=account_id))
+
+        return make_dataset_from_frames(stat_data)
+
+
+def iter_daily(files):
+    """Читает дневные отчеты по одному, files - [(файл, api_id, account_id), ...]
+    Возвращает пары (отчет, файл)"""
+
+    for file, api_id, account_id in files:
+        yield read_daily(file, api_id=api_id, account_id=account_id), file
+
+
+def iter_batches(frames, max_rows=200000, by_account=False):
+    """Собирает отчеты в порции не больше max_rows строк, отчеты читаются по мере сборки порций
+    frames - пары (отчет, файл), возвращает пары (порция, файлы порции)
+    Отчет больше max_rows отдается отдельной порцией
+    by_account=True - в порции только один аккаунт, при смене api_id начинается новая"""
+
+    batch = []
+    files = []
+    rows = 0
+    account = None
+    for frame, file in frames:
+        if frame is None or frame.shape[0] == 0:
+            files.append(file)
+            continue
+        frame_account = frame['api_id'].iat[0] if by_account is True else None
+        if len(batch) > 0 and (rows + frame.shape[0] > max_rows or frame_account != account):
+            yield pd.concat(batch, axis=0, ignore_index=True), files
+            batch = []
+            files = []
+            rows = 0
+        batch.append(frame)
+        files.append(file)
+        rows += frame.shape[0]
+        account = frame_account
+    if len(batch) > 0 or len(files) > 0:
+        yield (pd.concat(batch, axis=0, ignore_index=True) if len(batch) > 0 else pd.DataFrame()), files
+
+
+def copy_insert(logger=None):
+    """Метод записи для DataFrame.to_sql: каждая порция отправляется через COPY FROM STDIN"""
+
+    progress = {'rows': 0, 'chunks': 0}
+
+    def method(table, conn, keys, data_iter):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        rows = 0
+        for row in data_iter:
+            writer.writerow(row)
+            rows += 1
+        buffer.seek(0)
+
+        columns = ', '.join(f'"{key}"' for key in keys)
+        name = f'"{table.schema}"."{table.name}"' if table.schema else f'"{table.name}"'
+
+        with conn.connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {name} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+        progress['rows'] += rows
+        progress['chunks'] += 1
+        message = f"copy into {table.name}: chunk {progress['chunks']}, {progress['rows']} rows"
+        if logger is not None:
+            logger.info(message)
+        else:
+            print(message)
+
+    return method
+
+
+def add_into_table(dataset, table_name: str, engine, logger, attempts=1, copy=True, chunksize=50000,
+                   watermark_table=None):
+    """Выполнить запись датасета в таблицу БД
+    copy=True - запись через COPY FROM STDIN порциями по chunksize строк в одной транзакции
+    watermark_table - таблица последних дат, обновляется в той же транзакции"""
+
+    method = copy_insert(logger) if copy is True else None
+
+    n = 0
+    while n < attempts:
+        try:
+            start = time.perf_counter()
+            with engine.begin() as connection:
+                dataset.to_sql(name=table_name, con=connection, if_exists='append', index=False,
+                               method=method, chunksize=chunksize)
+                if watermark_table is not None:
+                    update_watermarks(dataset, watermark_table, connection)
+            metrics.get_metrics().observe_rows('inserted', dataset.shape[0], time.perf_counter() - start)
+            logger.info(f"Upload to {table_name} - ok")
+            return 'ok'
+        except BaseException as ex:
+            logger.error(f"data to db: {ex}")
+            time.sleep(5)
+            n += 1
+    logger.error("data to db error")
+    return None
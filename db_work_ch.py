@@ -1,8 +1,16 @@
+import hashlib
+import re
+import time
+
+import numpy as np
+import pandas as pd
 # from contextlib import contextmanager
 # import clickhouse_connect
 from clickhouse_connect.driver.exceptions import ClickHouseError, InterfaceError, DatabaseError, ProgrammingError
 # import config
 
+import metrics
+
 
 # @contextmanager
 # def get_client(logger) -> clickhouse_connect.get_client:
@@ -73,20 +81,259 @@ def get_last_dates(table_name: str, client, logger):
     return res
 
 
-def insert_data(dataset, table_name: str, client, logger):
-    """Записывает датасет в таблицу"""
+def get_coverage(table_name: str, date_from: str, client, logger, empty_table=None):
+    """Получить даты, по которым есть статистика, по аккаунтам начиная с date_from
+    empty_table - таблица дней без статистики, такие дни тоже считаются загруженными"""
+
+    query = f"""
+             SELECT 
+             api_id, 
+             date 
+             FROM {table_name} 
+             WHERE date >= '{date_from}'
+             GROUP BY api_id, date
+             """
+    if empty_table is not None:
+        query += f"""
+             UNION DISTINCT 
+             SELECT 
+             api_id, 
+             date 
+             FROM {empty_table} 
+             WHERE date >= '{date_from}'
+             """
+
+    try:
+        if empty_table is not None:
+            create_empty_days(empty_table, client)
+        res = client.query_df(query)
+    except (ClickHouseError, InterfaceError, DatabaseError) as ex:
+        logger.error(f"database error: {ex}")
+        res = None
+
+    return res
+
+
+def create_watermarks(table_name: str, client):
+    """Создать таблицу последних загруженных дат по аккаунтам"""
+
+    # при слиянии остается строка с наибольшей max_date
+    client.command(f"""
+                   CREATE TABLE IF NOT EXISTS {table_name} (
+                   api_id UInt64,
+                   max_date Date,
+                   updated_at DateTime DEFAULT now()
+                   ) ENGINE = ReplacingMergeTree(max_date)
+                   ORDER BY api_id
+                   """)
 
+
+def create_empty_days(table_name: str, client):
+    """Создать таблицу дней, за которые отчет получен, но статистики нет"""
+
+    client.command(f"""
+                   CREATE TABLE IF NOT EXISTS {table_name} (
+                   api_id UInt64,
+                   date Date
+                   ) ENGINE = ReplacingMergeTree
+                   ORDER BY (api_id, date)
+                   """)
+
+
+def add_empty_days(days, table_name: str, client, logger):
+    """Записать дни без статистики, days - [(api_id, date), ...]"""
+
+    if len(days) == 0:
+        return 'ok'
     try:
+        create_empty_days(table_name, client)
         client.insert(table=table_name,
-                      data=list(dataset.to_dict(orient='list').values()),
-                      column_names=list(dataset.columns),
-                      column_oriented=True
-                      )
+                      data=[[int(api_id) for api_id, _ in days], [day for _, day in days]],
+                      column_names=['api_id', 'date'],
+                      column_oriented=True)
+        logger.info(f"{len(days)} empty days recorded")
+        return 'ok'
+    except (ClickHouseError, InterfaceError, DatabaseError) as ex:
+        logger.error(f"database error: {ex}")
+        return None
+
 
-        logger.info(f"successfully {dataset.shape[0]} rows")
+def get_watermarks(table_name: str, client, logger):
+    """Получить последние загруженные даты по аккаунтам из таблицы watermark"""
+
+    query = f"""
+             SELECT 
+             api_id, 
+             max(max_date) as max_date 
+             FROM {table_name} 
+             GROUP BY (api_id)
+             """
+
+    try:
+        create_watermarks(table_name, client)
+        res = client.query_df(query)
+    except (ClickHouseError, InterfaceError, DatabaseError) as ex:
+        logger.error(f"database error: {ex}")
+        res = None
+
+    return res
+
+
+def update_watermarks(dataset, table_name: str, client, logger):
+    """Сдвинуть watermark по загруженному датасету"""
+
+    marks = dataset.groupby('api_id', as_index=False)['date'].max()
+
+    try:
+        client.insert(table=table_name,
+                      data=[marks['api_id'].tolist(), marks['date'].tolist()],
+                      column_names=['api_id', 'max_date'],
+                      column_oriented=True)
         return 'ok'
+    except (ClickHouseError, InterfaceError, DatabaseError) as ex:
+        logger.error(f"database error: {ex}")
+        return None
+
 
-    except (ProgrammingError, KeyError) as ex:
+def rebuild_watermarks(table_name: str, stat_table: str, client, logger):
+    """Пересобрать watermark по таблице статистики"""
+
+    try:
+        create_watermarks(table_name, client)
+        client.command(f"TRUNCATE TABLE {table_name}")
+        client.command(f"""
+                       INSERT INTO {table_name} (api_id, max_date) 
+                       SELECT api_id, max(date) 
+                       FROM {stat_table} 
+                       GROUP BY api_id
+                       """)
+        logger.info(f"{table_name} rebuilt")
+        return 'ok'
+    except (ClickHouseError, InterfaceError, DatabaseError) as ex:
         logger.error(f"database error: {ex}")
         return None
 
+
+def block_keys(dataset):
+    """Аккаунт и код даты по строкам (коды даты упорядочены как даты) - numpy-массивы без строк Python"""
+
+    api_ids = dataset['api_id'].to_numpy()
+    dates, _ = pd.factorize(dataset['date'], sort=True)
+    return api_ids, dates
+
+
+def is_grouped(api_ids, dates):
+    """Строки уже идут по api_id, а внутри аккаунта - по возрастанию даты"""
+
+    if api_ids.shape[0] < 2:
+        return True
+    same = api_ids[1:] == api_ids[:-1]
+    return bool(np.all((api_ids[1:] > api_ids[:-1]) | (same & (dates[1:] >= dates[:-1]))))
+
+
+def dedup_enabled(table_name: str, client, logger):
+    """Дедупликация вставок в таблице: Replicated*MergeTree или non_replicated_deduplication_window > 0
+    (в настройках таблицы или сервера). Без нее повтор блока дублирует строки"""
+
+    try:
+        engine = client.query(f"SELECT engine, engine_full FROM system.tables "
+                              f"WHERE database = currentDatabase() AND name = '{table_name}'").result_rows
+        if len(engine) == 0:
+            return False
+        if engine[0][0].startswith('Replicated'):
+            return True
+        window = re.search(r'non_replicated_deduplication_window\s*=\s*(\d+)', engine[0][1])
+        if window is None:
+            window = client.query("SELECT value FROM system.merge_tree_settings "
+                                  "WHERE name = 'non_replicated_deduplication_window'").result_rows
+            window = window[0][0] if len(window) > 0 else 0
+        else:
+            window = window.group(1)
+        return int(window) > 0
+    except (ClickHouseError, InterfaceError, DatabaseError) as ex:
+        logger.error(f"database error: {ex}")
+        return False
+
+
+def split_blocks(api_ids, dates, block_size):
+    """Границы блоков по целым дням аккаунтов: блок набирается из групп (api_id, date) до block_size строк,
+    группа больше block_size идет отдельным блоком. Ключи должны идти по api_id и дате"""
+
+    rows = api_ids.shape[0]
+    # позиции начала групп
+    starts = (np.flatnonzero((api_ids[1:] != api_ids[:-1]) | (dates[1:] != dates[:-1])) + 1).tolist() + [rows]
+    bounds = []
+    begin = 0
+    for start, end in zip([0] + starts[:-1], starts):
+        if end - begin > block_size and start > begin:
+            bounds.append((begin, start))
+            begin = start
+    if rows > begin:
+        bounds.append((begin, rows))
+    return bounds
+
+
+def block_token(table_name: str, chunk):
+    """Токен дедупликации блока: одинаковый для одинаковых данных, повтор вставки не добавляет строк"""
+
+    digest = hashlib.sha1(pd.util.hash_pandas_object(chunk, index=False).to_numpy().tobytes()).hexdigest()
+    return f"{table_name}:{digest}"
+
+
+def insert_data(dataset, table_name: str, client, logger, block_size=100000, attempts=3, delay=5,
+                watermark_table=None, dedup=False):
+    """Записывает датасет в таблицу блоками до block_size строк, блоки режутся по целым дням аккаунтов
+    dedup=True - у каждого блока insert_deduplication_token, повтор блока после сбоя идемпотентен
+    (включать только для таблиц с дедупликацией, см. dedup_enabled);
+    dedup=False - блок не повторяется, после ошибки запись прекращается
+    watermark_table - таблица последних дат, сдвигается после каждого записанного блока:
+    записанные дни аккаунта полные, при ошибке недописанные дни остаются пропусками;
+    если watermark не обновился, возвращается None"""
+
+    rows = dataset.shape[0]
+    written_bytes = 0
+    start = time.monotonic()
+    if dedup is not True:
+        attempts = 1
+
+    api_ids, dates = block_keys(dataset)
+    # отсортированный датасет режется срезами без копирования, иначе блоки выбираются по порядку сортировки
+    order = None if is_grouped(api_ids, dates) else np.lexsort((dates, api_ids))
+    if order is not None:
+        api_ids, dates = api_ids[order], dates[order]
+
+    for begin, end in split_blocks(api_ids, dates, block_size):
+        chunk = dataset.iloc[begin:end] if order is None else dataset.take(order[begin:end])
+        settings = {'insert_deduplication_token': block_token(table_name, chunk)} if dedup is True else None
+        n = 0
+        while True:
+            try:
+                summary = client.insert_df(table=table_name, df=chunk, settings=settings)
+                break
+            except (ProgrammingError, KeyError) as ex:
+                logger.error(f"database error: {ex}")
+                return None
+            except (ClickHouseError, InterfaceError, DatabaseError) as ex:
+                n += 1
+                logger.error(f"rows {begin}-{end}, attempt {n}: {ex}")
+                if n >= attempts:
+                    return None
+                time.sleep(delay)
+
+        # объем от сервера, без него неизвестен
+        summary = getattr(summary, 'summary', None) or {}
+        if written_bytes is not None and 'written_bytes' in summary:
+            written_bytes += int(summary['written_bytes'])
+        else:
+            written_bytes = None
+        # блоки идут по api_id и дате: по каждому аккаунту блока записаны все дни до его последней даты
+        if watermark_table is not None and update_watermarks(chunk, watermark_table, client, logger) is None:
+            logger.error(f"rows {begin}-{end} written, watermark not updated")
+            return None
+
+    elapsed = max(time.monotonic() - start, 1e-6)
+    written = f"{written_bytes / 1e6:.1f} MB" if written_bytes is not None else "written bytes unknown"
+    logger.info(f"successfully {rows} rows, {rows / elapsed:.0f} rows/s, {written}")
+    metrics.get_metrics().observe_rows('inserted', rows, elapsed)
+
+    return 'ok'
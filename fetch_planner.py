@@ -0,0 +1,187 @@
+from datetime import date, timedelta
+
+import pandas as pd
+
+
+def build_coverage(data):
+    """
+    Индекс покрытия: api_id -> множество дат, по которым статистика уже загружена или получен пустой отчет
+    None, если покрытие получить не удалось (тогда используется только watermark)
+    """
+    if data is None:
+        return None
+    coverage = {}
+    if data.shape[0] == 0:
+        return coverage
+    dates = pd.to_datetime(data['date']).dt.date
+    for api_id, day in zip(data['api_id'].astype('int64'), dates):
+        coverage.setdefault(int(api_id), set()).add(day)
+    return coverage
+
+
+def missing_ranges(covered, date_from, date_to):
+    """
+    Непрерывные промежутки дат из [date_from, date_to], которых нет в covered
+    Возвращает список [[dt_fr, dt_to], ...] строками '%Y-%m-%d'
+    """
+    if isinstance(date_from, str):
+        date_from = date.fromisoformat(date_from)
+    if isinstance(date_to, str):
+        date_to = date.fromisoformat(date_to)
+
+    ranges = []
+    start = None
+    day = date_from
+    while day <= date_to:
+        if day not in covered:
+            if start is None:
+                start = day
+        elif start is not None:
+            ranges.append([str(start), str(day - timedelta(days=1))])
+            start = None
+        day += timedelta(days=1)
+    if start is not None:
+        ranges.append([str(start), str(date_to)])
+    return ranges
+
+
+def merge_ranges(ranges, max_gap=0):
+    """
+    Объединяет промежутки, между которыми не больше max_gap загруженных дней, в один запрос
+    Уже загруженные дни внутри объединенного промежутка отбрасываются перед записью
+    """
+    merged = []
+    for dt_fr, dt_to in ranges:
+        if len(merged) > 0 and (date.fromisoformat(dt_fr) - date.fromisoformat(merged[-1][1])).days - 1 <= max_gap:
+            merged[-1][1] = dt_to
+        else:
+            merged.append([dt_fr, dt_to])
+    return merged
+
+
+def empty_days(date_from, date_to, dates, settled_before=None):
+    """
+    Дни из [date_from, date_to], по которым в отчете нет строк
+    settled_before - более поздние дни не считаются пустыми, статистика по ним может еще появиться
+    """
+    day = date.fromisoformat(date_from)
+    last = date.fromisoformat(date_to)
+    if settled_before is not None:
+        last = min(last, settled_before - timedelta(days=1))
+    res = []
+    while day <= last:
+        if day not in dates:
+            res.append(day)
+        day += timedelta(days=1)
+    return res
+
+
+def range_days(ranges):
+    """
+    Количество дней в промежутках
+    """
+    return sum((date.fromisoformat(dt_to) - date.fromisoformat(dt_fr)).days + 1 for dt_fr, dt_to in ranges)
+
+
+def campaign_active_dates(campaign):
+    """
+    Даты активности кампании по данным списка кампаний: [начало, конец], None - граница неизвестна
+    Статистики нет до создания кампании и после даты окончания кампании (toDate), если она задана
+    updatedAt границей не считается: изменение кампании не означает ее остановку, без toDate конец открыт
+    """
+    start = (campaign.get('createdAt') or '')[:10] or None
+    end = (campaign.get('toDate') or '')[:10] or None
+    return [start, end]
+
+
+def attribution_dates(active):
+    """
+    Даты для отчетов attribution: заказы приписываются кампании и после остановки, поэтому конец не ограничивается
+    """
+    if active is None:
+        return None
+    return {camp: [dates[0], None] for camp, dates in active.items()}
+
+
+def _days(campaigns, date_from, date_to, active):
+    """Дни запрашиваемого промежутка, в которые кампания могла показываться: id -> (первый, последний)"""
+
+    days = {}
+    for camp in campaigns:
+        start, end = (active or {}).get(camp) or (None, None)
+        first = max(date_from, date.fromisoformat(start)) if start else date_from
+        last = min(date_to, date.fromisoformat(end)) if end else date_to
+        if first <= last:
+            days[camp] = (first, last)
+    return days
+
+
+def _cover(intervals, day_lim):
+    """Наименьший набор окон до day_lim дней, покрывающий все промежутки: окно начинается с первого
+    непокрытого дня, конец окна сдвигается к последнему покрытому им дню"""
+
+    windows = []
+    limit = None
+    for first, last in sorted(intervals):
+        while first <= last:
+            if limit is None or first > limit:
+                windows.append([first, first])
+                limit = first + timedelta(days=day_lim - 1)
+            covered = min(last, limit)
+            windows[-1][1] = max(windows[-1][1], covered)
+            first = covered + timedelta(days=1)
+    return windows
+
+
+def _plan_by_chunks(days, camp_lim, day_lim):
+    # кампании с близкими датами попадают в одну пачку, для пачки окна строятся по ее датам
+    order = sorted(days, key=lambda camp: days[camp])
+    plan = []
+    for i in range(0, len(order), camp_lim):
+        chunk = order[i:i + camp_lim]
+        for first, last in _cover([days[camp] for camp in chunk], day_lim):
+            active = [camp for camp in chunk if days[camp][0] <= last and days[camp][1] >= first]
+            if len(active) > 0:
+                plan.append((active, [first, last]))
+    return plan
+
+
+def _plan_by_windows(days, camp_lim, day_lim):
+    # окна строятся по датам всех кампаний, в каждом окне пачки только из активных в нем кампаний
+    plan = []
+    for first, last in _cover(list(days.values()), day_lim):
+        active = [camp for camp in days if days[camp][0] <= last and days[camp][1] >= first]
+        for i in range(0, len(active), camp_lim):
+            plan.append((active[i:i + camp_lim], [first, last]))
+    return plan
+
+
+def plan_requests(campaigns, date_from, date_to, camp_lim, day_lim, active=None):
+    """
+    План заказа отчетов: список (кампании, [dt_fr, dt_to]) с пачками не больше camp_lim кампаний
+    и окнами не больше day_lim дней, покрывающий дни активности каждой кампании в [date_from, date_to]
+    active - даты активности {id: [начало, конец]} (campaign_active_dates), без них кампания активна весь промежуток
+    Из двух раскладок (по пачкам и по окнам) выбирается та, где меньше отчетов
+    """
+    if isinstance(date_from, str):
+        date_from = date.fromisoformat(date_from)
+    if isinstance(date_to, str):
+        date_to = date.fromisoformat(date_to)
+
+    days = _days(campaigns, date_from, date_to, active)
+    if len(days) == 0:
+        return []
+
+    plan = min(_plan_by_chunks(days, camp_lim, day_lim), _plan_by_windows(days, camp_lim, day_lim), key=len)
+    return [(chunk, [str(first), str(last)]) for chunk, (first, last) in plan]
+
+
+def format_plan(plan, baseline=None):
+    """
+    Текст плана для пробного запуска, baseline - количество отчетов без планирования (все пачки на все окна)
+    """
+    lines = [f'{dt_fr} - {dt_to}: {len(chunk)} кампаний ({", ".join(map(str, chunk))})' for chunk, (dt_fr, dt_to) in plan]
+    lines.append(f'отчетов: {len(plan)}')
+    if baseline is not None:
+        lines.append(f'без планирования: {baseline}')
+    return '\n'.join(lines)
@@ -0,0 +1,101 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class PooledAdapter(HTTPAdapter):
+    """
+    Адаптер с пулом keep-alive соединений, считает открытые соединения
+    """
+    def __init__(self, on_new_conn, **kwargs):
+        self.on_new_conn = on_new_conn
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        on_new_conn = self.on_new_conn
+
+        class CountingHTTPConnectionPool(HTTPConnectionPool):
+            def _new_conn(self):
+                on_new_conn()
+                return super()._new_conn()
+
+        class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+            def _new_conn(self):
+                on_new_conn()
+                return super()._new_conn()
+
+        self.poolmanager.pool_classes_by_scheme = {'http': CountingHTTPConnectionPool,
+                                                   'https': CountingHTTPSConnectionPool}
+
+
+class HttpSession:
+    """
+    Общая потокобезопасная сессия для всех запросов к API
+    pool_connections - количество хостов в пуле
+    pool_maxsize - количество соединений на хост
+    """
+    def __init__(self, pool_connections=10, pool_maxsize=32, timeout=None):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.opened = 0
+        self.requests = 0
+
+        self.session = requests.Session()
+        adapter = PooledAdapter(self._conn_opened, pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _conn_opened(self):
+        with self.lock:
+            self.opened += 1
+
+    def request(self, method, url, **kwargs):
+        """
+        Выполнить запрос через пул соединений
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        with self.lock:
+            self.requests += 1
+        return self.session.request(method, url, **kwargs)
+
+    def stats(self):
+        """
+        Счетчики соединений за запуск
+        """
+        with self.lock:
+            return {'requests': self.requests,
+                    'connections_opened': self.opened,
+                    'connections_reused': max(self.requests - self.opened, 0)}
+
+    def close(self):
+        self.session.close()
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def configure(pool_connections=10, pool_maxsize=32, timeout=None):
+    """
+    Пересоздает общую сессию с заданными параметрами пула
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = HttpSession(pool_connections=pool_connections, pool_maxsize=pool_maxsize, timeout=timeout)
+        return _session
+
+
+def get_session():
+    """
+    Возвращает общую сессию, создает при первом обращении
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = HttpSession()
+        return _session
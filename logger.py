@@ -1,15 +1,32 @@
+import atexit
 import logging
 import logging.handlers
+import queue
 
 
 def password_token_filter(log: logging.LogRecord) -> int:
-    if 'password' in str(log.msg) or 'token' in str(log.msg):
+    msg = str(log.msg)
+    if 'password' in msg or 'token' in msg:
         return 0
     else:
         return 1
 
 
-def init_logger():
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Кладет запись в очередь, форматирование и фильтры выполняет поток QueueListener
+    В вызывающем потоке только подставляются аргументы сообщения
+    """
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def init_logger(queued=False):
+    """
+    queued=True - обработчики работают в отдельном потоке, рабочие потоки только ставят записи в очередь
+    """
     logger = logging.getLogger(__name__)
     logger.setLevel(logging.DEBUG)
 
@@ -30,6 +47,17 @@ def init_logger():
     file_handler.setFormatter(formatter)
     file_handler.addFilter(password_token_filter)
 
+    if queued is True:
+        log_queue = queue.SimpleQueue()
+        qh = LazyQueueHandler(log_queue)
+        qh.setLevel(logging.INFO)
+        listener = logging.handlers.QueueListener(log_queue, sh, fh, file_handler, respect_handler_level=True)
+        listener.start()
+        # оставшиеся в очереди записи дописываются при выходе
+        atexit.register(listener.stop)
+        logger.addHandler(qh)
+        return logger
+
     logger.addHandler(sh)
     logger.addHandler(fh)
     logger.addHandler(file_handler)
@@ -0,0 +1,237 @@
+import json
+import os
+import re
+import threading
+import time
+
+# границы корзин гистограмм: длительность запроса, сек и количество опросов статуса отчета
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+POLL_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+# uuid отчетов и числовые id в пути заменяются, чтобы endpoint не зависел от запроса
+_ID = re.compile(r'^(\d+|[0-9a-fA-F]{8}-[0-9a-fA-F-]{27})$')
+
+
+def endpoint_name(url):
+    """
+    Имя метода API по адресу запроса: /api/client/statistics/<uuid> -> statistics/:id
+    """
+    path = url.split('?')[0].split('/api/client/')[-1]
+    return '/'.join(':id' if _ID.match(part) else part for part in path.strip('/').split('/'))
+
+
+def status_class(status_code):
+    """
+    Группа ответа для счетчиков: 429 отдельно, остальные по классу 2xx, 4xx, 5xx
+    """
+    if status_code is None:
+        return 'error'
+    if status_code == 429:
+        return '429'
+    return f'{status_code // 100}xx'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def quantile(self, q):
+        """
+        Оценка квантиля по границам корзин
+        """
+        if self.count == 0:
+            return None
+        for bound, count in zip(self.buckets, self.counts):
+            if count >= q * self.count:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    """
+    Метрики запуска: задержки и ответы по методам API, время запросов по аккаунтам,
+    опросы статусов отчетов, скачанные байты, строки разобранные и записанные в БД
+    Выгружаются в textfile для node_exporter (Prometheus) и в json-сводку запуска
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.latency = {}
+        self.responses = {}
+        self.bytes = {}
+        self.accounts = {}
+        self.polls = Histogram(POLL_BUCKETS)
+        self.reports = []
+        self.rows = {}
+
+    def observe_request(self, endpoint, seconds, status_code=None, size=0, account=None):
+        """
+        Запрос к API: длительность, код ответа (None - исключение), размер ответа
+        """
+        with self.lock:
+            self.latency.setdefault(endpoint, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            key = (endpoint, status_class(status_code))
+            self.responses[key] = self.responses.get(key, 0) + 1
+            self.bytes[endpoint] = self.bytes.get(endpoint, 0) + size
+            if account is not None:
+                stat = self.accounts.setdefault(account, {'requests': 0, 'seconds': 0.0, 'bytes': 0})
+                stat['requests'] += 1
+                stat['seconds'] += seconds
+                stat['bytes'] += size
+
+    def observe_report(self, uuid, name, state, polls, seconds):
+        """
+        Итог ожидания отчета: количество опросов статуса и время от заказа до сохранения
+        """
+        with self.lock:
+            self.polls.observe(polls)
+            self.reports.append({'uuid': uuid, 'name': name, 'state': state, 'polls': polls,
+                                 'seconds': round(seconds, 2)})
+
+    def observe_rows(self, stage, rows, seconds):
+        """
+        Строки, обработанные на этапе stage (parsed, inserted) за seconds секунд
+        """
+        with self.lock:
+            stat = self.rows.setdefault(stage, {'rows': 0, 'seconds': 0.0})
+            stat['rows'] += int(rows)
+            stat['seconds'] += seconds
+
+    def summary(self):
+        """
+        Сводка запуска: методы и аккаунты отсортированы по затраченному времени
+        """
+        with self.lock:
+            endpoints = {}
+            for endpoint, hist in self.latency.items():
+                endpoints[endpoint] = {'requests': hist.count,
+                                       'seconds': round(hist.sum, 2),
+                                       'p50': hist.quantile(0.5),
+                                       'p95': hist.quantile(0.95),
+                                       'bytes': self.bytes.get(endpoint, 0),
+                                       'responses': {code: n for (name, code), n in self.responses.items()
+                                                     if name == endpoint}}
+            rows = {stage: {'rows': stat['rows'], 'seconds': round(stat['seconds'], 2),
+                            'rows_per_s': round(stat['rows'] / stat['seconds']) if stat['seconds'] > 0 else None}
+                    for stage, stat in self.rows.items()}
+            return {'started': self.started,
+                    'seconds': round(time.time() - self.started, 2),
+                    'endpoints': dict(sorted(endpoints.items(), key=lambda x: -x[1]['seconds'])),
+                    'accounts': dict(sorted(((account, {**stat, 'seconds': round(stat['seconds'], 2)})
+                                             for account, stat in self.accounts.items()),
+                                            key=lambda x: -x[1]['seconds'])),
+                    'responses_429': sum(n for (_, code), n in self.responses.items() if code == '429'),
+                    'responses_5xx': sum(n for (_, code), n in self.responses.items() if code == '5xx'),
+                    'bytes': sum(self.bytes.values()),
+                    'reports': list(self.reports),
+                    'rows': rows}
+
+    def to_prometheus(self, prefix='ozon_perf'):
+        """
+        Метрики в текстовом формате Prometheus
+        """
+        lines = []
+        with self.lock:
+            lines += [f'# HELP {prefix}_request_seconds API request latency by endpoint',
+                      f'# TYPE {prefix}_request_seconds histogram']
+            for endpoint, hist in sorted(self.latency.items()):
+                lines += _histogram(f'{prefix}_request_seconds', hist, f'endpoint="{endpoint}"')
+
+            lines += [f'# HELP {prefix}_responses_total API responses by endpoint and status class',
+                      f'# TYPE {prefix}_responses_total counter']
+            for (endpoint, code), n in sorted(self.responses.items()):
+                lines.append(f'{prefix}_responses_total{{endpoint="{endpoint}",code="{code}"}} {n}')
+
+            lines += [f'# HELP {prefix}_response_bytes_total Downloaded bytes by endpoint',
+                      f'# TYPE {prefix}_response_bytes_total counter']
+            for endpoint, size in sorted(self.bytes.items()):
+                lines.append(f'{prefix}_response_bytes_total{{endpoint="{endpoint}"}} {size}')
+
+            lines += [f'# HELP {prefix}_account_request_seconds_total Time spent in API requests by account',
+                      f'# TYPE {prefix}_account_request_seconds_total counter']
+            for account, stat in sorted(self.accounts.items()):
+                lines.append(f'{prefix}_account_request_seconds_total{{account="{account}"}} {stat["seconds"]:.3f}')
+
+            lines += [f'# HELP {prefix}_report_polls Status polls per report',
+                      f'# TYPE {prefix}_report_polls histogram']
+            lines += _histogram(f'{prefix}_report_polls', self.polls)
+
+            lines += [f'# HELP {prefix}_rows_total Rows processed by stage',
+                      f'# TYPE {prefix}_rows_total counter']
+            for stage, stat in sorted(self.rows.items()):
+                lines.append(f'{prefix}_rows_total{{stage="{stage}"}} {stat["rows"]}')
+            lines += [f'# HELP {prefix}_rows_per_second Rows per second by stage',
+                      f'# TYPE {prefix}_rows_per_second gauge']
+            for stage, stat in sorted(self.rows.items()):
+                if stat['seconds'] > 0:
+                    lines.append(f'{prefix}_rows_per_second{{stage="{stage}"}} {stat["rows"] / stat["seconds"]:.1f}')
+
+            lines += [f'# HELP {prefix}_last_run_timestamp_seconds Start time of the last run',
+                      f'# TYPE {prefix}_last_run_timestamp_seconds gauge',
+                      f'{prefix}_last_run_timestamp_seconds {self.started:.0f}']
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        """
+        Записывает метрики для textfile collector, файл заменяется целиком
+        """
+        _write(path, self.to_prometheus())
+
+    def write_summary(self, path):
+        """
+        Записывает json-сводку запуска
+        """
+        _write(path, json.dumps(self.summary(), ensure_ascii=False, indent=2))
+
+
+def _histogram(name, hist, labels=''):
+    sep = ',' if labels else ''
+    lines = [f'{name}_bucket{{{labels}{sep}le="{bound}"}} {count}' for bound, count in zip(hist.buckets, hist.counts)]
+    lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {hist.count}')
+    suffix = f'{{{labels}}}' if labels else ''
+    lines.append(f'{name}_sum{suffix} {hist.sum:.3f}')
+    lines.append(f'{name}_count{suffix} {hist.count}')
+    return lines
+
+
+def _write(path, content):
+    # запись через временный файл, чтобы сборщик не прочитал файл наполовину
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as file:
+        file.write(content)
+    os.replace(tmp, path)
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def configure():
+    """
+    Создает новый набор метрик запуска
+    """
+    global _metrics
+    with _metrics_lock:
+        _metrics = Metrics()
+        return _metrics
+
+
+def get_metrics():
+    """
+    Возвращает общий набор метрик, создает при первом обращении
+    """
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
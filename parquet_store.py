@@ -0,0 +1,77 @@
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.dataset
+except ImportError:
+    pyarrow = None
+
+
+def available():
+    """
+    Доступна ли запись parquet (нужен pyarrow)
+    """
+    return pyarrow is not None
+
+
+def _require():
+    if pyarrow is None:
+        raise ImportError('parquet_store requires pyarrow: pip install pyarrow')
+
+
+def write_partitioned(dataset, root, date_column='date', account_column='api_id'):
+    """
+    Пишет датасет в parquet с разбиением по аккаунту и дате: root/api_id=.../date=.../*.parquet
+    Партиции аккаунтов и дат датасета заменяются целиком: датасет должен содержать все данные аккаунта за день
+    (все кампании), иначе ранее записанные строки остальных кампаний этого дня удаляются
+    """
+    _require()
+    if dataset.shape[0] == 0:
+        return
+    data = dataset.copy()
+    # значения партиций хранятся в пути, дата - строкой в формате ISO
+    data[date_column] = pd.to_datetime(data[date_column]).dt.strftime('%Y-%m-%d')
+    # повторная запись тех же аккаунта и даты заменяет партицию, а не дублирует ее
+    data.to_parquet(root, engine='pyarrow', partition_cols=[account_column, date_column], index=False,
+                    existing_data_behavior='delete_matching')
+
+
+def has_data(root):
+    """
+    Есть ли в root записанные parquet-файлы
+    """
+    if not os.path.isdir(root):
+        return False
+    for _, _, files in os.walk(root):
+        if any(file.endswith('.parquet') for file in files):
+            return True
+    return False
+
+
+def read_partitioned(root, columns=None, date_from=None, date_to=None, api_ids=None,
+                     date_column='date', account_column='api_id'):
+    """
+    Читает датасет из parquet, читаются только нужные колонки и партиции
+    date_from, date_to - границы дат 'YYYY-MM-DD' включительно, api_ids - список аккаунтов
+    """
+    _require()
+    filters = []
+    if date_from is not None:
+        filters.append((date_column, '>=', str(date_from)))
+    if date_to is not None:
+        filters.append((date_column, '<=', str(date_to)))
+    if api_ids is not None:
+        filters.append((account_column, 'in', [int(api_id) for api_id in api_ids]))
+
+    data = pd.read_parquet(root, engine='pyarrow', columns=columns, filters=filters or None,
+                           partitioning=pyarrow.dataset.partitioning(
+                               pyarrow.schema([(account_column, pyarrow.int64()),
+                                               (date_column, pyarrow.string())]), flavor='hive'))
+
+    if date_column in data.columns:
+        data[date_column] = pd.to_datetime(data[date_column].astype(str), format='%Y-%m-%d').dt.date
+    if account_column in data.columns:
+        data[account_column] = data[account_column].astype('int64')
+    return data
@@ -2,25 +2,53 @@ import pandas as pd
 import numpy as np
 import os
 from datetime import datetime, date, timedelta
-from threading import Thread
 from sqlalchemy import create_engine
 import clickhouse_connect
 import shutil
+import threading
 
 import config
 import logger
 import db_work
 import db_work_ch
+import http_session
+import cache
+import rate_limiter
+import fetch_planner
+import parquet_store
+import metrics
+import report_poller
+from worker_pool import WorkerPool
+from upload_pipeline import UploadPipeline
 from ozon_performance import OzonPerformance
 # from ozon_performance import DbWorking
 
 
-logger = logger.init_logger()
+logger = logger.init_logger(queued=config.log_queue == 1)
 
+session = http_session.configure(pool_connections=config.http_pool_connections,
+                                 pool_maxsize=config.http_pool_maxsize)
+cache.configure_token_cache(path=config.token_cache_file, refresh_margin=config.token_refresh_margin)
+cache.configure_discovery_cache(path=config.discovery_cache_file, ttl=config.discovery_ttl)
+cache.configure_checkpoints(path=config.checkpoint_file, ttl=config.checkpoint_ttl)
+report_poller.configure_build_times(path=config.build_times_file)
+limiter = rate_limiter.configure(rate=config.rate_per_client, burst=config.rate_burst,
+                                 global_rate=config.rate_global, global_burst=config.rate_global_burst,
+                                 max_rate=config.rate_max_per_client)
+run_metrics = metrics.configure()
 
-def get_reports(*args):
+# отчеты копятся на диске и пишутся порциями после загрузки, при конвейерной записи не используется
+stream_batches = config.stream_batch_rows > 0 and config.pipeline_writers == 0
 
-    api_id = args[1].split('-')[0]
+# дни, за которые отчет получен, но статистики нет: (api_id, date), пишутся в покрытие после загрузки
+empty_days = []
+empty_days_lock = threading.Lock()
+
+
+def get_date_from(client_id):
+    """Дата, с которой нужно загрузить статистику аккаунта"""
+
+    api_id = client_id.split('-')[0]
 
     try:
         last_date = last_dates[last_dates['api_id'] == int(api_id)]['max_date'].values[0]
@@ -28,100 +56,292 @@ def get_reports(*args):
         # date_from = str(last_date + timedelta(days=1))
 
     except (IndexError, KeyError, ValueError):
-        date_from = str(date.today() - timedelta(days=90))
+        date_from = str(date.today() - timedelta(days=config.lookback_days))
 
+    return date_from
+
+
+def get_missing_ranges(client_id):
+    """Промежутки дат, которых нет в покрытии по аккаунту"""
+
+    date_from = get_date_from(client_id)
     date_to = str(date.today() - timedelta(days=1))
 
-    ozon = OzonPerformance(account_id=args[0], client_id=args[1], client_secret=args[2])
+    if coverage is None:
+        return [[date_from, date_to]] if date_from <= date_to else []
 
-    if ozon.auth is not None:
-        ozon.collect_data(date_from, date_to, daily=True)
-        ozon.save_data(path_=config.path_, daily=True)
+    # пропуски ищутся в окне lookback_days, все после watermark считается незагруженным
+    start = min(date_from, str(date.today() - timedelta(days=config.lookback_days)))
+    return fetch_planner.missing_ranges(coverage.get(int(client_id.split('-')[0]), set()), start, date_to)
+
+
+def get_date_ranges(client_id):
+    """Запросы daily по аккаунту: пропуски, близкие друг к другу, запрашиваются одним промежутком"""
+
+    return fetch_planner.merge_ranges(get_missing_ranges(client_id), max_gap=config.gap_merge_days)
+
+
+def get_backlog(client_id):
+    """Количество дней, которые нужно загрузить по аккаунту"""
+
+    return fetch_planner.range_days(get_missing_ranges(client_id))
+
+
+def record_empty_days(api_id, date_from, date_to, dates):
+    """Запоминает дни промежутка без статистики, чтобы не запрашивать их в следующих запусках"""
 
+    settled = date.today() - timedelta(days=config.empty_settle_days)
+    days = fetch_planner.empty_days(date_from, date_to, dates, settled_before=settled)
+    with empty_days_lock:
+        empty_days.extend((int(api_id), day) for day in days)
 
-if config.using_db == 'postgres':
-    engine = create_engine(config.PG_DB_PARAMS)
-    accounts = db_work.get_accounts(engine, logger).drop_duplicates(subset=['key_attribute_value', 'attribute_value'], keep='last')
-    last_dates = db_work.get_last_dates(table_name=config.stat_table, engine=engine, logger=logger)
 
-elif config.using_db == 'clickhouse':
+def get_reports(*args):
 
-    client = clickhouse_connect.get_client(
-        interface='https',
-        host=config.CH_HOST,
-        port=config.CH_PORT,
-        username=config.CH_USER,
-        password=config.CH_PASSWORD,
-        database=config.CH_DB_NAME,
-        secure=True,
-        verify=True,
-        ca_cert=config.CH_CA_CERTS
-    )
+    ranges = get_date_ranges(args[1])
+    if len(ranges) == 0:
+        return None
 
-    # client = db_work_ch.get_client(logger)
+    ozon = OzonPerformance(account_id=args[0], client_id=args[1], client_secret=args[2], api_url=config.api_url)
+    api_id = args[1].split('-')[0]
 
-    accounts = db_work_ch.get_accounts(client=client, logger=logger).drop_duplicates(subset=['client_id', 'client_secret'], keep='last')
-    last_dates = db_work_ch.get_last_dates(table_name=config.stat_table, client=client, logger=logger)
+    if ozon.auth is not None:
+        frames = []
+        files = []
+        for date_from, date_to in ranges:
+            # без списка кампаний collect_data бросает DiscoveryError: задание аккаунта завершается ошибкой,
+            # и дни промежутка не записываются пустыми
+            ozon.collect_data(date_from, date_to, daily=True)
+            if ozon.st_dai is None:
+                continue
+            # файлы на диск сохраняются для отладки и для потоковой записи порциями
+            if config.spool_files == 1 or stream_batches:
+                ozon.save_data(path_=config.path_, daily=True)
+            if stream_batches:
+                record_empty_days(api_id, date_from, date_to, db_work.daily_dates(ozon.st_dai.content))
+                files.append((ozon.daily_file, api_id, args[0]))
+                continue
+            frame = db_work.read_daily(ozon.st_dai.content, api_id=api_id, account_id=args[0])
+            record_empty_days(api_id, date_from, date_to, set(frame['date']))
+            # промежуток мог захватить уже загруженные дни
+            frame = db_work.drop_covered(frame, coverage)
+            # типизированная копия в parquet для повторной сборки без разбора csv;
+            # дневной отчет содержит все кампании аккаунта за дни промежутка, партиции заменяются целиком
+            if config.parquet_store == 1:
+                parquet_store.write_partitioned(frame, config.parquet_path + 'daily')
+            frames.append(frame)
+        # при потоковой записи результат - файлы этого запуска, они читаются порциями после загрузки
+        if stream_batches:
+            return files
+        return db_work.make_dataset_from_frames(frames)
+
+
+def load_reports(pipeline, *args):
+    """Загружает отчеты аккаунта и сразу отдает их на запись, в памяти пула данные не остаются"""
+
+    dataset = get_reports(*args)
+    if dataset is not None:
+        pipeline.put(f'{args[0]}-{args[1]}', dataset)
+
+
+def download_accounts(accounts, pipeline=None):
+    """
+    Загружает отчеты аккаунтов в общем пуле, аккаунты с большим отставанием загружаются первыми
+    accounts - ключи аккаунтов (account_id, client_id, client_secret)
+    pipeline - UploadPipeline: данные аккаунта пишутся в БД сразу после его загрузки
+    """
+    pool = WorkerPool(workers=config.workers, logger=logger)
+    for account_id, client_id, client_secret in accounts:
+        if pipeline is not None:
+            pool.submit(f'{account_id}-{client_id}', load_reports, pipeline, account_id, client_id, client_secret,
+                        priority=get_backlog(client_id))
+        else:
+            pool.submit(f'{account_id}-{client_id}', get_reports, account_id, client_id, client_secret,
+                        priority=get_backlog(client_id))
 
-else:
-    raise Exception("Incorrect database")
+    pool.run()
 
-threads = []
-for index, keys in accounts.iterrows():
-    client_id = keys[1]
-    client_secret = keys[2]
-    account_id = keys[0]
+    logger.info(f"jobs: {pool.summary()}")
+    logger.info(f"http connections: {session.stats()}")
+    logger.info(f"rate limits: {limiter.stats()}")
 
-    threads.append(Thread(target=get_reports, args=(account_id, client_id, client_secret)))
+    return pool
 
 
-print(threads)
+def export_metrics():
+    """Сохраняет метрики запуска в textfile Prometheus и json-сводку"""
 
-# запускаем потоки
-for thread in threads:
-    thread.start()
+    try:
+        if config.metrics_textfile is not None:
+            run_metrics.write_textfile(config.metrics_textfile)
+        if config.metrics_summary is not None:
+            run_metrics.write_summary(config.metrics_summary)
+    except OSError as ex:
+        logger.error(f"metrics export: {ex}")
 
-# останавливаем потоки
-for thread in threads:
-    thread.join()
 
+def upload(dataset):
+    """Записывает датасет в БД запуска, None - ошибка записи"""
 
-df = db_work.make_dataset(path=config.path_)
+    if config.using_db == 'postgres':
+        return db_work.add_into_table(dataset=dataset, table_name=config.stat_table, engine=engine,
+                                      logger=logger, attempts=1, chunksize=config.PG_COPY_CHUNK,
+                                      watermark_table=config.watermark_table)
+    elif config.using_db == 'clickhouse':
+        return db_work_ch.insert_data(dataset=dataset, table_name=config.stat_table, client=client, logger=logger,
+                                      block_size=config.CH_INSERT_BLOCK, dedup=ch_dedup,
+                                      watermark_table=config.watermark_table)
 
-if df is None:
-    logger.info("no downloaded files")
 
-else:
-    if df.shape[0] == 0:
+def upload_batch(batch):
+    """Записывает порцию данных, пустые пропускаются, при upl_into_db != 1 не пишется ничего"""
+
+    if stream_batches:
+        batch = db_work.drop_covered(batch, coverage)
+    if batch.shape[0] == 0:
         logger.info("no stat data for period")
+        return 'ok'
+    # файл дневного отчета не делится между порциями: день аккаунта приходит в партицию целиком
+    if config.parquet_store == 1 and stream_batches:
+        parquet_store.write_partitioned(batch, config.parquet_path + 'daily')
+    if config.upl_into_db != 1:
+        return 'ok'
+    return upload(batch)
+
+
+def upload_batches(batches):
+    """Записывает порции по очереди, batches - пары (порция, файлы порции)
+    Возвращает (количество порций, 'ok' или None при ошибке)
+    Файлы записанной порции сразу удаляются. После ошибки следующие порции не пишутся,
+    watermark не уходит дальше незаписанных данных, и они загружаются заново следующим запуском"""
+
+    n_batches = 0
+    uploaded = 'ok'
+    for batch, files in batches:
+        n_batches += 1
+        logger.info(f"batch {n_batches}: {batch.shape[0]} rows")
+        uploaded = upload_batch(batch)
+        if uploaded is None:
+            break
+        for file in files:
+            try:
+                os.remove(file)
+            except OSError as ex:
+                logger.error(f"remove {file}: {ex}")
+    return n_batches, uploaded
+
+
+# покрытие и последние даты по аккаунтам, без БД все загружается за lookback_days
+coverage = None
+last_dates = pd.DataFrame(columns=['api_id', 'max_date'])
+
+if __name__ == '__main__':
+    if config.using_db == 'postgres':
+        engine = create_engine(config.PG_DB_PARAMS)
+        accounts = db_work.get_accounts(engine, logger).drop_duplicates(subset=['key_attribute_value', 'attribute_value'], keep='last')
+        last_dates = db_work.get_watermarks(table_name=config.watermark_table, engine=engine, logger=logger)
+        # первый запуск: watermark заполняется по таблице статистики
+        if last_dates is not None and last_dates.shape[0] == 0:
+            db_work.rebuild_watermarks(table_name=config.watermark_table, stat_table=config.stat_table,
+                                       engine=engine, logger=logger)
+            last_dates = db_work.get_watermarks(table_name=config.watermark_table, engine=engine, logger=logger)
+        if config.fill_gaps == 1:
+            coverage = fetch_planner.build_coverage(db_work.get_coverage(
+                table_name=config.stat_table, date_from=str(date.today() - timedelta(days=config.lookback_days)),
+                engine=engine, logger=logger, empty_table=config.empty_days_table))
+
+    elif config.using_db == 'clickhouse':
+
+        client = clickhouse_connect.get_client(
+            interface='https',
+            host=config.CH_HOST,
+            port=config.CH_PORT,
+            username=config.CH_USER,
+            password=config.CH_PASSWORD,
+            database=config.CH_DB_NAME,
+            secure=True,
+            verify=True,
+            ca_cert=config.CH_CA_CERTS,
+            compress=config.CH_COMPRESS
+        )
+
+        # client = db_work_ch.get_client(logger)
+
+        # без дедупликации в таблице повтор блока дублирует строки, тогда блоки не повторяются
+        ch_dedup = config.CH_INSERT_DEDUP == 1 and db_work_ch.dedup_enabled(config.stat_table, client, logger)
+        if config.CH_INSERT_DEDUP == 1 and not ch_dedup:
+            logger.info(f"{config.stat_table}: no insert deduplication, failed blocks are not retried")
+
+        accounts = db_work_ch.get_accounts(client=client, logger=logger).drop_duplicates(subset=['client_id', 'client_secret'], keep='last')
+        last_dates = db_work_ch.get_watermarks(table_name=config.watermark_table, client=client, logger=logger)
+        # первый запуск: watermark заполняется по таблице статистики
+        if last_dates is not None and last_dates.shape[0] == 0:
+            db_work_ch.rebuild_watermarks(table_name=config.watermark_table, stat_table=config.stat_table,
+                                          client=client, logger=logger)
+            last_dates = db_work_ch.get_watermarks(table_name=config.watermark_table, client=client, logger=logger)
+        if config.fill_gaps == 1:
+            coverage = fetch_planner.build_coverage(db_work_ch.get_coverage(
+                table_name=config.stat_table, date_from=str(date.today() - timedelta(days=config.lookback_days)),
+                client=client, logger=logger, empty_table=config.empty_days_table))
 
     else:
-        if config.upl_into_db == 1:
-            if config.using_db == 'postgres':
-                upload = db_work.add_into_table(dataset=df, table_name=config.stat_table, engine=engine,
-                                                logger=logger, attempts=1)
-                if upload is not None:
-                    logger.info("Upload to postgres_db successful")
-                else:
-                    logger.error('Upload to postgres_db error')
-            elif config.using_db == 'clickhouse':
-                upload = db_work_ch.insert_data(dataset=df, table_name=config.stat_table, client=client, logger=logger)
-                if upload is not None:
-                    logger.info("Upload to ch_db successful")
-                else:
-                    logger.error('Upload to ch_db error')
-        else:
-            logger.info('Upl to db canceled')
+        raise Exception("Incorrect database")
+
+    keys = accounts.iloc[:, :3].itertuples(index=False, name=None)
+
+    if config.pipeline_writers > 0:
+        # загрузка и запись идут одновременно, медленный аккаунт не задерживает запись остальных
+        pipeline = UploadPipeline(upload_batch, writers=config.pipeline_writers, max_pending=config.pipeline_queue,
+                                  logger=logger).start()
+        download_accounts(keys, pipeline=pipeline)
+        result = pipeline.close()
+        logger.info(f"pipeline: {result}")
+        n_batches = result['batches']
+        uploaded = 'ok' if result['failed'] == 0 else None
 
-    if config.delete_files == 1:
-        try:
-            shutil.rmtree(config.path_)
-            logger.info('Files (folder) deleted')
-        except OSError as e:
-            logger.error("Error: %s - %s." % (e.filename, e.strerror))
     else:
-        logger.info('Delete canceled')
+        pool = download_accounts(keys)
+
+        if stream_batches:
+            # читаются только файлы, сохраненные заданиями этого запуска, а не вся папка:
+            # в ней могут остаться файлы прошлого запуска за тот же день
+            files = [file for job in pool.jobs if job.result is not None for file in job.result]
+            # отчеты читаются с диска и пишутся порциями, в памяти не больше одной порции
+            batches = db_work.iter_batches(db_work.iter_daily(files), max_rows=config.stream_batch_rows,
+                                           by_account=config.stream_by_account == 1)
+        else:
+            df = db_work.make_dataset_from_frames([job.result for job in pool.jobs if job.result is not None])
+            batches = [] if df is None else [(df, [])]
+            del df
 
+        n_batches, uploaded = upload_batches(batches)
+
+    # пустые дни - итог загрузки, а не записи: отчет за них получен и строк в нем нет
+    if config.upl_into_db == 1 and len(empty_days) > 0:
+        if config.using_db == 'postgres':
+            db_work.add_empty_days(empty_days, table_name=config.empty_days_table, engine=engine, logger=logger)
+        else:
+            db_work_ch.add_empty_days(empty_days, table_name=config.empty_days_table, client=client, logger=logger)
 
+    if n_batches == 0:
+        logger.info("no downloaded reports")
 
+    else:
+        if config.upl_into_db != 1:
+            logger.info('Upl to db canceled')
+        elif uploaded is not None:
+            logger.info(f"Upload to {config.using_db} successful")
+        else:
+            logger.error(f'Upload to {config.using_db} error')
+
+        # незаписанные порции не читаются повторно: их дни не отмечены загруженными и запрашиваются заново
+        if config.delete_files == 1:
+            try:
+                shutil.rmtree(config.path_)
+                logger.info('Files (folder) deleted')
+            except OSError as e:
+                logger.error("Error: %s - %s." % (e.filename, e.strerror))
+        else:
+            logger.info('Delete canceled')
 
+    export_metrics()
@@ -0,0 +1,25 @@
+import argparse
+
+import config
+import cache
+from ozon_performance import OzonPerformance
+
+# пробный запуск: план заказа отчетов statistics (или phrases) по аккаунту без заказа
+# python plan_requests.py <client_id> <client_secret> 2023-01-01 2023-12-31 [--phrases]
+parser = argparse.ArgumentParser()
+parser.add_argument('client_id')
+parser.add_argument('client_secret')
+parser.add_argument('date_from')
+parser.add_argument('date_to')
+parser.add_argument('--phrases', action='store_true', help='план с объектами кампаний для отчетов по фразам')
+parser.add_argument('--camp-lim', type=int, default=8)
+parser.add_argument('--day-lim', type=int, default=70)
+args = parser.parse_args()
+
+cache.configure_token_cache(path=config.token_cache_file, refresh_margin=config.token_refresh_margin)
+cache.configure_discovery_cache(path=config.discovery_cache_file, ttl=config.discovery_ttl)
+
+ozon = OzonPerformance(client_id=args.client_id, client_secret=args.client_secret, camp_lim=args.camp_lim,
+                       day_lim=args.day_lim, api_url=config.api_url)
+if ozon.auth is not None:
+    ozon.collect_data(args.date_from, args.date_to, statistics=True, phrases=args.phrases, dry_run=True)
@@ -0,0 +1,125 @@
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+class TokenBucket:
+    """
+    Корзина токенов: rate - запросов в секунду, capacity - допустимый всплеск
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def reserve(self, now):
+        """
+        Резервирует один запрос, возвращает время ожидания до него, сек
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+
+def parse_retry_after(value):
+    """
+    Retry-After в секундах или в формате HTTP-даты
+    """
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """
+    Общий ограничитель запросов: глобальная корзина и корзина на каждый client_id
+    При 429 скорость по ключу снижается в decrease раз и запросы по ключу приостанавливаются
+    на Retry-After, при успешных ответах скорость растет на increase до max_rate
+    max_rate=None - скорость восстанавливается только до заданной rate, выше не поднимается
+    """
+    def __init__(self, rate=2.0, burst=5, global_rate=20.0, global_burst=20,
+                 min_rate=0.1, max_rate=None, increase=0.05, decrease=0.5):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate if max_rate is not None else rate
+        self.increase = increase
+        self.decrease = decrease
+        self.glob = TokenBucket(global_rate, global_burst)
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def _bucket(self, key):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def acquire(self, key):
+        """
+        Ждет, пока запрос по ключу укладывается в лимиты
+        """
+        with self.lock:
+            now = time.monotonic()
+            wait = max(self.glob.reserve(now), self._bucket(key).reserve(now))
+        if wait > 0:
+            time.sleep(wait)
+
+    def on_response(self, key, status_code, retry_after=None):
+        """
+        Подстраивает скорость по ответу сервера
+        """
+        with self.lock:
+            bucket = self._bucket(key)
+            if status_code == 429:
+                bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+                pause = parse_retry_after(retry_after)
+                if pause is None:
+                    pause = 1 / bucket.rate
+                bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + pause)
+            elif status_code < 400:
+                bucket.rate = min(self.max_rate, bucket.rate + self.increase)
+
+    def stats(self):
+        """
+        Текущая скорость по ключам
+        """
+        with self.lock:
+            return {key: round(bucket.rate, 3) for key, bucket in self.buckets.items()}
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def configure(**kwargs):
+    """
+    Пересоздает общий ограничитель с заданными параметрами
+    """
+    global _limiter
+    with _limiter_lock:
+        _limiter = RateLimiter(**kwargs)
+        return _limiter
+
+
+def get_limiter():
+    """
+    Возвращает общий ограничитель, создает при первом обращении
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
@@ -0,0 +1,36 @@
+from sqlalchemy import create_engine
+import clickhouse_connect
+
+import config
+import logger
+import db_work
+import db_work_ch
+
+
+logger = logger.init_logger()
+
+# пересобирает таблицу последних дат по таблице статистики (после ручных правок или сбоев)
+if config.using_db == 'postgres':
+    engine = create_engine(config.PG_DB_PARAMS)
+    db_work.rebuild_watermarks(table_name=config.watermark_table, stat_table=config.stat_table,
+                               engine=engine, logger=logger)
+
+elif config.using_db == 'clickhouse':
+
+    client = clickhouse_connect.get_client(
+        interface='https',
+        host=config.CH_HOST,
+        port=config.CH_PORT,
+        username=config.CH_USER,
+        password=config.CH_PASSWORD,
+        database=config.CH_DB_NAME,
+        secure=True,
+        verify=True,
+        ca_cert=config.CH_CA_CERTS
+    )
+
+    db_work_ch.rebuild_watermarks(table_name=config.watermark_table, stat_table=config.stat_table,
+                                  client=client, logger=logger)
+
+else:
+    raise Exception("Incorrect database")
@@ -0,0 +1,259 @@
+import math
+import random
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cache
+import metrics
+
+
+class Backoff:
+    """
+    Интервалы опроса статуса: первый - ожидаемое время формирования отчета (first), если оно известно,
+    дальше от min_interval с ростом в factor раз до max_interval, каждый со случайным разбросом +-jitter
+    """
+    def __init__(self, first=None, min_interval=1, max_interval=10, factor=1.5, jitter=0.2, rng=None):
+        self.first = first
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.jitter = jitter
+        self.rng = rng if rng is not None else random.Random()
+        self.n = 0
+
+    def next_delay(self):
+        if self.n == 0 and self.first is not None:
+            delay = self.first
+        else:
+            step = self.n - 1 if self.first is not None else self.n
+            delay = min(self.max_interval, self.min_interval * self.factor ** step)
+        self.n += 1
+        return max(delay * self.rng.uniform(1 - self.jitter, 1 + self.jitter), 0)
+
+
+class BuildTimes:
+    """
+    Время формирования отчетов по прошлым запускам: по виду отчета и размеру (кампаний x дней),
+    размеры округляются до степени двойки, новое значение входит в среднее с весом alpha
+    """
+    def __init__(self, cache_, alpha=0.3, ttl=30 * 86400):
+        self.cache = cache_
+        self.alpha = alpha
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def bucket(size):
+        return str(2 ** round(math.log2(max(size or 1, 1))))
+
+    def estimate(self, kind, size):
+        """
+        Ожидаемое время формирования, сек: по своему размеру или по ближайшему известному, None - оценки нет
+        """
+        if kind is None:
+            return None
+        times = self.cache.get(kind) or {}
+        if len(times) == 0:
+            return None
+        bucket = self.bucket(size)
+        if bucket in times:
+            return times[bucket]
+        nearest = min(times, key=lambda b: abs(math.log2(int(b)) - math.log2(int(bucket))))
+        return times[nearest]
+
+    def observe(self, kind, size, seconds):
+        if kind is None:
+            return
+        with self.lock:
+            times = self.cache.get(kind) or {}
+            bucket = self.bucket(size)
+            old = times.get(bucket)
+            times[bucket] = round(seconds if old is None else old + self.alpha * (seconds - old), 2)
+            self.cache.set(kind, times, ttl=self.ttl)
+
+
+class ReportJob:
+    """
+    Отчет, ожидающий формирования на стороне Ozon
+    state: состояние Ozon (NOT_STARTED, IN_PROGRESS, OK, ERROR) или итоговое SAVED, TIMEOUT, FAILED
+    kind, size - вид отчета и размер (кампаний x дней) для оценки времени формирования
+    ordered - время заказа (time.time()), для отчетов прошлого запуска - из контрольной точки
+    """
+    def __init__(self, ozon, uuid, name, key=None, kind=None, size=None, ordered=None):
+        self.ozon = ozon
+        self.uuid = uuid
+        self.name = name
+        self.key = key
+        self.kind = kind
+        self.size = size
+        self.ordered = ordered if ordered is not None else time.time()
+        self.state = 'NOT_STARTED'
+        self.polls = 0
+        self.errors = 0
+        self.started = time.monotonic()
+        self.finished = None
+        self.backoff = None
+        self.next_poll = None
+        self.last_poll = None
+
+
+class ReportPoller:
+    """
+    Опрашивает статусы всех ожидающих отчетов и скачивает каждый, как только он готов
+    У каждого отчета свое расписание: первый опрос - к ожидаемому времени готовности по прошлым запускам,
+    дальше интервал растет от min_interval до interval со случайным разбросом jitter
+    interval - наибольшая пауза между опросами отчета, сек
+    max_wait - максимальное время ожидания всех отчетов, сек
+    max_errors - количество неудачных запросов статуса подряд, после которого отчет считается FAILED
+    run_metrics - метрики запуска, по умолчанию общие
+    build_times - оценки времени формирования, по умолчанию общие
+    """
+    TERMINAL = ('SAVED', 'ERROR', 'TIMEOUT', 'FAILED')
+
+    def __init__(self, interval=10, max_wait=3600, workers=8, max_errors=5, run_metrics=None,
+                 min_interval=1, factor=1.5, jitter=0.2, build_times=None):
+        self.interval = interval
+        self.max_wait = max_wait
+        self.workers = workers
+        self.max_errors = max_errors
+        self.metrics = run_metrics if run_metrics is not None else metrics.get_metrics()
+        self.min_interval = min(min_interval, interval)
+        self.factor = factor
+        self.jitter = jitter
+        self.build_times = build_times if build_times is not None else get_build_times()
+        self.rng = random.Random()
+        self.jobs = []
+        self.lock = threading.Lock()
+
+    def add(self, ozon, uuid, name, key=None, kind=None, size=None, ordered=None):
+        """
+        Добавить отчет в очередь опроса, name - путь для сохранения файла
+        key - ключ контрольной точки отчета в ozon.checkpoints, итог ожидания записывается туда
+        """
+        job = ReportJob(ozon, uuid, name, key=key, kind=kind, size=size, ordered=ordered)
+        job.backoff = Backoff(first=self.build_times.estimate(kind, size), min_interval=self.min_interval,
+                              max_interval=self.interval, factor=self.factor, jitter=self.jitter, rng=self.rng)
+        # отсчет первого интервала - от заказа, отчет прошлого запуска может быть уже готов
+        first = job.backoff.next_delay() - (time.time() - job.ordered)
+        job.next_poll = time.monotonic() + max(first, 0)
+        with self.lock:
+            self.jobs.append(job)
+        return job
+
+    def pending(self):
+        with self.lock:
+            return [job for job in self.jobs if job.state not in self.TERMINAL]
+
+    def run(self):
+        """
+        Опрашивает отчеты по их расписанию до готовности всех или до истечения max_wait
+        """
+        deadline = time.monotonic() + self.max_wait
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = self.pending()
+            while len(pending) > 0:
+                now = time.monotonic()
+                if now >= deadline:
+                    # последний опрос всех оставшихся, неготовые считаются просроченными
+                    list(executor.map(self._poll, pending))
+                    for job in self.pending():
+                        self._finish(job, 'TIMEOUT')
+                        print('Превышено время ожидания отчета', job.uuid)
+                    break
+                due = [job for job in pending if job.next_poll <= now]
+                if len(due) > 0:
+                    list(executor.map(self._poll, due))
+                    pending = self.pending()
+                    continue
+                time.sleep(min(min(job.next_poll for job in pending), deadline) - now)
+        return self.summary()
+
+    def _poll(self, job):
+        job.polls += 1
+        try:
+            response = job.ozon.status_report(uuid=job.uuid)
+            state = response.json()['state'] if response is not None else None
+        except Exception as ex:
+            print(ex)
+            state = None
+
+        now = time.time()
+        if state is None:
+            job.errors += 1
+            if job.errors >= self.max_errors:
+                self._finish(job, 'FAILED')
+            else:
+                job.next_poll = time.monotonic() + job.backoff.next_delay()
+            return
+
+        job.errors = 0
+        job.state = state
+        print(job.uuid, state)
+        if state == 'OK':
+            # отчет был готов между прошлым и этим опросом, берется середина
+            previous = job.last_poll if job.last_poll is not None else job.ordered
+            self.build_times.observe(job.kind, job.size, (previous + now) / 2 - job.ordered)
+            try:
+                self._download(job)
+            except Exception as ex:
+                print(ex)
+                self._finish(job, 'FAILED')
+        elif state == 'ERROR':
+            self._finish(job, 'ERROR')
+            print('Ошибка формирования отчета', job.uuid)
+        else:
+            job.last_poll = now
+            job.next_poll = time.monotonic() + job.backoff.next_delay()
+
+    def _download(self, job):
+        report = job.ozon.get_report(uuid=job.uuid)
+        if report is None:
+            self._finish(job, 'FAILED')
+            return
+        with open(job.name, 'wb') as file:
+            file.write(report.content)
+        self._finish(job, 'SAVED')
+        print('Сохранен', job.name, f'{len(report.content) / 1e6:.2f} MB, опросов {job.polls}')
+
+    def _finish(self, job, state):
+        job.state = state
+        job.finished = time.monotonic()
+        self.metrics.observe_report(job.uuid, job.name, state, job.polls, job.finished - job.started)
+        if job.key is not None:
+            job.ozon.checkpoints.finish(job.key, state, job.name)
+
+    def summary(self):
+        """
+        Количество отчетов по итоговым состояниям
+        """
+        res = {}
+        with self.lock:
+            for job in self.jobs:
+                res[job.state] = res.get(job.state, 0) + 1
+        return res
+
+
+_build_times = None
+_build_times_lock = threading.Lock()
+
+
+def configure_build_times(path=None, alpha=0.3):
+    """
+    Пересоздает общие оценки времени формирования отчетов, path - файл для хранения между запусками
+    """
+    global _build_times
+    with _build_times_lock:
+        _build_times = BuildTimes(cache.JsonCache(path), alpha=alpha)
+        return _build_times
+
+
+def get_build_times():
+    """
+    Возвращает общие оценки времени формирования, по умолчанию только в памяти
+    """
+    global _build_times
+    with _build_times_lock:
+        if _build_times is None:
+            _build_times = BuildTimes(cache.JsonCache())
+        return _build_times
@@ -0,0 +1,80 @@
+"""
+Векторное объединение колонок DbWorking.coalesce_columns против прежнего построчного apply
+по каждой паре COALESCE_COLUMNS
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from ozon_performance import DbWorking
+
+PAIRS = DbWorking.COALESCE_COLUMNS
+
+
+def legacy_coalesce(dataset):
+    """Построчное объединение до векторизации"""
+
+    for target, first, second, missing in PAIRS:
+        dataset[target] = dataset[[first, second]].fillna(missing).apply(
+            lambda x: x.iloc[0] if x.iloc[1] == missing else x.iloc[1], axis=1)
+        dataset.drop(columns=[first, second], inplace=True)
+    return dataset
+
+
+def pair_frame(first_values, second_values):
+    """Датасет со всеми парами, у каждой пары значения first_values/second_values"""
+
+    data = {}
+    for _, first, second, _ in PAIRS:
+        data[first] = first_values
+        data[second] = second_values
+    return pd.DataFrame(data, dtype=object)
+
+
+def assert_same(frame):
+    old = legacy_coalesce(frame.copy())
+    new = DbWorking.coalesce_columns(frame.copy())
+    # новые версии pandas выводят строковый dtype у результата apply, сравниваются значения
+    pd.testing.assert_frame_equal(old.astype(object), new.astype(object))
+    return new
+
+
+CASES = {
+    'only_first': (['1,5', 'a'], [None, np.nan]),
+    'only_second': ([None, np.nan], ['2,5', 'b']),
+    'both': (['1,5', 'a'], ['2,5', 'b']),
+    'both_nan': ([None, np.nan], [np.nan, None]),
+    'empty_strings': (['', '1,5'], ['', '']),
+    'nan_strings': (['nan', '1,5'], ['nan', 'nan']),
+}
+
+
+@pytest.mark.parametrize('case', CASES)
+def test_coalesce_matches_legacy(case):
+    first_values, second_values = CASES[case]
+    new = assert_same(pair_frame(first_values, second_values))
+
+    assert list(new.columns) == [target for target, _, _, _ in PAIRS]
+
+
+def test_coalesce_values():
+    new = DbWorking.coalesce_columns(pair_frame(['1', None, '3', None], [None, '2', '4', None]))
+
+    for target, _, _, missing in PAIRS:
+        # вторая колонка в приоритете, без значений в обеих - маркер пропуска пары
+        assert new[target].tolist() == ['1', '2', '4', missing]
+
+
+def test_coalesce_mixed_rows_matches_legacy():
+    rng = np.random.default_rng(0)
+    rows = 500
+    data = {}
+    for _, first, second, missing in PAIRS:
+        choice = rng.integers(0, 4, rows)
+        values = np.array([f'{v:.2f}'.replace('.', ',') for v in rng.uniform(0, 1000, rows)], dtype=object)
+        data[first] = np.where(choice == 1, None, values)
+        data[second] = np.where(choice == 0, None, np.where(choice == 3, missing, values[::-1]))
+    frame = pd.DataFrame(data, dtype=object)
+    frame.iloc[::7, :] = None
+
+    assert_same(frame)
@@ -0,0 +1,63 @@
+"""
+Однопроходное чтение отчетов statistics против прежнего двухпроходного по образцам каждого варианта шапки
+Образцы в tests/fixtures: строка с номером кампании, шапка, данные (со строкой из пропусков), строка итогов
+"""
+import glob
+import io
+import os
+
+import pandas as pd
+import pytest
+
+from ozon_performance import DbWorking
+
+FIXTURES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'fixtures', 'stat_*.csv')))
+
+
+def legacy_read_stat_csv(file):
+    """Чтение до однопроходного разбора: шапка и данные через python-парсер ради skipfooter, номер кампании -
+    вторым чтением"""
+
+    with open(file, 'rb') as f:
+        content = f.read()
+    data = pd.read_csv(io.BytesIO(content), sep=';', header=1, skipfooter=1, engine='python')
+    camp = pd.read_csv(io.BytesIO(content), sep=';', header=0, nrows=0).columns[-1].split(',')[0].split()[-1]
+    return camp, data
+
+
+def test_fixtures_cover_all_variants():
+    assert len(FIXTURES) == 5
+
+
+@pytest.mark.parametrize('file', FIXTURES, ids=os.path.basename)
+def test_read_stat_csv_matches_legacy(file):
+    old_camp, old = legacy_read_stat_csv(file)
+    new_camp, new = DbWorking.read_stat_csv(file)
+
+    assert new_camp == old_camp
+    pd.testing.assert_frame_equal(new, old)
+
+
+@pytest.mark.parametrize('file', FIXTURES, ids=os.path.basename)
+def test_read_stat_csv_bytes_and_path(file):
+    with open(file, 'rb') as f:
+        content = f.read()
+    camp, data = DbWorking.read_stat_csv(content)
+    path_camp, path_data = DbWorking.read_stat_csv(file)
+
+    assert camp == path_camp
+    pd.testing.assert_frame_equal(data, path_data)
+    # строка итогов отрезана
+    assert not data.iloc[:, 0].astype(str).str.startswith('Всего').any()
+
+
+@pytest.mark.parametrize('file', FIXTURES, ids=os.path.basename)
+def test_stat_read_trans2_matches_legacy(file, monkeypatch):
+    new = DbWorking.stat_read_trans2(file, api_id='111', account_id='1')
+    monkeypatch.setattr(DbWorking, 'read_stat_csv', staticmethod(legacy_read_stat_csv))
+    old = DbWorking.stat_read_trans2(file, api_id='111', account_id='1')
+
+    pd.testing.assert_frame_equal(new, old)
+    # строка из пропусков отброшена
+    assert new.shape[0] == 4
+    assert set(new['actionnum']) == {legacy_read_stat_csv(file)[0]}
@@ -0,0 +1,88 @@
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class UploadPipeline:
+    """
+    Конвейер записи в БД: потоки загрузки кладут данные аккаунтов в ограниченную очередь,
+    writers потоков записи забирают их и пишут, пока продолжается загрузка остальных аккаунтов
+    Когда очередь заполнена, put ждет, и загрузка замедляется до скорости записи
+    upload - функция записи датасета, возвращает None при ошибке
+    max_pending - размер очереди, датасетов
+    """
+    def __init__(self, upload, writers=1, max_pending=4, logger=None):
+        self.upload = upload
+        self.writers = writers
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.logger = logger
+        self.threads = []
+        self.lock = threading.Lock()
+        self.results = {}
+        self.rows = 0
+        self.wait_seconds = 0.0
+        self.write_seconds = 0.0
+
+    def start(self):
+        self.threads = [threading.Thread(target=self._writer, daemon=True) for _ in range(self.writers)]
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def put(self, key, dataset):
+        """
+        Отдает данные аккаунта на запись, ждет, если писатели не успевают
+        """
+        start = time.monotonic()
+        self.queue.put((key, dataset))
+        with self.lock:
+            self.wait_seconds += time.monotonic() - start
+
+    def _writer(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            key, dataset = item
+            start = time.monotonic()
+            try:
+                result = self.upload(dataset)
+            except Exception as ex:
+                result = None
+                if self.logger is not None:
+                    self.logger.error(f"upload {key}: {ex}")
+            duration = time.monotonic() - start
+            with self.lock:
+                self.results[key] = result
+                self.write_seconds += duration
+                if result is not None:
+                    self.rows += dataset.shape[0]
+            if self.logger is not None:
+                if result is not None:
+                    self.logger.info(f"upload {key}: {dataset.shape[0]} rows, {duration:.1f} s")
+                else:
+                    self.logger.error(f"upload {key}: error")
+
+    def close(self):
+        """
+        Дожидается записи всех данных в очереди и останавливает потоки записи
+        """
+        for _ in self.threads:
+            self.queue.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+        return self.summary()
+
+    def summary(self):
+        """
+        Записанные и неудачные датасеты, строки, время ожидания загрузки и время записи
+        """
+        with self.lock:
+            failed = sum(1 for result in self.results.values() if result is None)
+            return {'batches': len(self.results),
+                    'failed': failed,
+                    'rows': self.rows,
+                    'wait_seconds': round(self.wait_seconds, 1),
+                    'write_seconds': round(self.write_seconds, 1)}
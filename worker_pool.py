@@ -0,0 +1,83 @@
+import itertools
+import queue
+import threading
+import time
+
+
+class Job:
+    """
+    Задача пула: время выполнения и результат сохраняются после запуска
+    status: queued, running, ok, error
+    """
+    def __init__(self, key, func, args, priority=0):
+        self.key = key
+        self.func = func
+        self.args = args
+        self.priority = priority
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.started = None
+        self.duration = None
+
+
+class WorkerPool:
+    """
+    Ограниченный пул потоков, задачи с большим priority выполняются первыми
+    """
+    def __init__(self, workers=8, logger=None):
+        self.workers = workers
+        self.logger = logger
+        self.jobs = []
+        self.queue = queue.PriorityQueue()
+        self.counter = itertools.count()
+
+    def submit(self, key, func, *args, priority=0):
+        job = Job(key, func, args, priority=priority)
+        self.jobs.append(job)
+        self.queue.put((-priority, next(self.counter), job))
+        return job
+
+    def _worker(self):
+        while True:
+            try:
+                _, _, job = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            job.status = 'running'
+            job.started = time.monotonic()
+            try:
+                job.result = job.func(*job.args)
+                job.status = 'ok'
+            except Exception as ex:
+                job.error = ex
+                job.status = 'error'
+            job.duration = time.monotonic() - job.started
+            if self.logger is not None:
+                if job.status == 'ok':
+                    self.logger.info(f"job {job.key}: ok, {job.duration:.1f} s")
+                else:
+                    self.logger.error(f"job {job.key}: {job.error}, {job.duration:.1f} s")
+
+    def run(self):
+        """
+        Выполняет все задачи и ждет завершения
+        """
+        threads = [threading.Thread(target=self._worker) for _ in range(min(self.workers, max(len(self.jobs), 1)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.jobs
+
+    def summary(self):
+        """
+        Количество задач по результату и суммарное время
+        """
+        res = {'ok': 0, 'error': 0, 'seconds': 0.0}
+        for job in self.jobs:
+            res[job.status] = res.get(job.status, 0) + 1
+            res['seconds'] += job.duration or 0.0
+        res['seconds'] = round(res['seconds'], 1)
+        return res
+